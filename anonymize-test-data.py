@@ -1,44 +1,96 @@
 import click
 import random
 import json
-import re
 
+from names import NameIndex
 
-@click.command()
-@click.option('--players', help='the json file containing the players.', required=True)
-def run(players):
 
-    with open(players,'r') as infile:
-        players = json.load(infile)
+def iter_players(infile, chunk_size=1 << 16):
+    # the objects of a json list one at a time, reading the file a chunk at a time
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
 
-    names = [p['name'] for p in players]
-    for player in players:
-        player['new_friends'] = ''
-        player['new_avoid'] = ''
+    def more():
+        nonlocal buffer, pos, eof
+        chunk = infile.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def next_char():
+        # the next character that isn't whitespace, '' at the end of the file
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            more()
+
+    if next_char() != '[':
+        raise ValueError("the players file should be a json list")
+    pos += 1
+    if next_char() == ']':
+        return
+    while True:
+        while True:
+            try:
+                player, pos = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more()
+        yield player
+        char = next_char()
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError(f"expected , or ] in the players file, found {char!r}")
+        pos += 1
+        next_char()
 
-    for i, name in enumerate(names):
-        replaceName = 'p{}'.format(i)
-        boundary = r"[^-_a-zA-Z0-9]"
-        pattern = r"({1}|^){0}({1}|$)".format(name, boundary)
-
-        for player in players:
-            if player['name'] == name:
-                player['name'] = replaceName
-            if re.search(pattern, player['friends'], re.I):
-                player['new_friends'] = player['new_friends'] + " " + replaceName
-            if re.search(pattern, player['avoid'], re.I):
-                player['new_avoid'] = player['new_avoid'] + " " + replaceName
 
+def write_players(players, outfile):
+    # the same text as json.dumps(list(players), indent=4), written one player at a time
+    first = True
     for player in players:
-        player['friends'] = player.pop('new_friends').strip()
-        player['avoid'] = player.pop('new_avoid').strip()
+        outfile.write('[\n    ' if first else ',\n    ')
+        outfile.write(json.dumps(player, indent=4).replace('\n', '\n    '))
+        first = False
+    outfile.write('[]\n' if first else '\n]\n')
+
+
+@click.command()
+@click.option('--players', help='the json file containing the players.', required=True)
+@click.option('--output', default='-', help='file to write the anonymized json to (stdout by default)')
+@click.option('--seed', type=int, default=None, help='seed for shuffling the ratings')
+def run(players, output, seed):
+    # The file is read twice without being held in memory: once for the names and ratings, then
+    # to write each player out with everyone's name replaced by p{their position}, everywhere
+    # they are mentioned. Ratings are shuffled between players
+    names = []
+    ratings = []
+    with open(players, 'r') as infile:
+        for player in iter_players(infile):
+            names.append(player['name'])
+            ratings.append(player['rating'])
+    index = NameIndex(names)
+    new_names = {}
+    for i, name in enumerate(names):
+        new_names.setdefault(name, 'p{}'.format(i))
+    random.Random(seed).shuffle(ratings)
 
-    ratings = [player['rating'] for player in players]
-    random.shuffle(ratings)
-    for player, rating in zip(players, ratings):
-        player['rating'] = rating
+    def anonymized(infile):
+        for player, rating in zip(iter_players(infile), ratings):
+            player['name'] = new_names[player['name']]
+            player['friends'] = ' '.join('p{}'.format(i) for i in index.positions(player['friends']))
+            player['avoid'] = ' '.join('p{}'.format(i) for i in index.positions(player['avoid']))
+            player['rating'] = rating
+            yield player
 
-    print(json.dumps(players, indent=4))
+    with open(players, 'r') as infile, click.open_file(output, 'w') as outfile:
+        write_players(anonymized(infile), outfile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+import click
+import random
+import json
+import time
+import sys
+import signal
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+import maketeams3
+
+# manifest entries need "players", everything else defaults as in maketeams3
+DEFAULTS = {'boards': 6, 'balance': 0.8, 'count': 100, 'seed': None, 'keep': 100, 'variance_iterations': 200,
+            'engine': 'python', 'output': 'readable', 'file': None}
+
+
+def read_manifest(path):
+    # a json list of jobs, each a dict of maketeams3 options
+    with open(path) as infile:
+        jobs = json.load(infile)
+    jobs = [dict(DEFAULTS, **job) for job in jobs]
+    for job in jobs:
+        if job['seed'] is None:
+            job['seed'] = random.randrange(2**32)
+        if job['file'] is None:
+            stem = job['players'].rsplit('.', 1)[0]
+            job['file'] = f"{stem}-{job['boards']}-{job['balance']}.{'json' if job['output'] == 'json' else 'txt'}"
+    return jobs
+
+
+_batch = None
+
+def _set_batch(specs):
+    # every job's spec and options are sent once per worker, tasks only name the job
+    global _batch
+    _batch = specs
+
+def _start_worker(specs):
+    # interrupts are left to the main process
+    _set_batch(specs)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _make_leagues(job, seeds):
+    spec, job = _batch[job]
+    return [maketeams3.pack_league(maketeams3.make_league(spec, seed)) for seed in seeds]
+
+def _reduce_league(job, packed):
+    spec, job = _batch[job]
+    league = maketeams3.reduce_league(maketeams3.unpack_league(spec, packed), job['variance_iterations'],
+                                      engine=job['engine'])
+    return maketeams3.pack_league(league)
+
+
+class LocalPool:
+    # runs tasks as they are submitted, for --jobs 1
+    def __init__(self, specs):
+        _set_batch(specs)
+
+    def submit(self, fun, *args):
+        return Done(fun(*args))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class Done:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+def write_job(job, spec, best, reduced):
+    # the same output as a maketeams3 run with the job's options, json output has only the upload
+    min_range_league = min(reduced, key=lambda l: maketeams3.team_rating_range(l['teams']))
+    with open(job['file'], 'w') as outfile, redirect_stdout(outfile):
+        if job['output'] == 'readable':
+            print(f"Using seed {job['seed']}")
+            print(f"{best.ties} leagues of happiness {best.happiness} found, {len(best.leagues)} different ones kept")
+        maketeams3.print_results(best.leagues, min_range_league, job['output'])
+    return min_range_league
+
+
+def run_batch(jobs, n_workers):
+    # All restarts of all jobs are queued on one pool first, then all the variance reductions.
+    # Results are collected in seed order, so each job picks the leagues a single run would
+    start = time.perf_counter()
+    specs = []
+    for job in jobs:
+        player_data, names = maketeams3.read_players(job['players'])
+        spec = maketeams3.compile_league(player_data, job['boards'], job['balance'], names)
+        specs.append((spec, job))
+    pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_start_worker, initargs=(specs,)) \
+        if n_workers > 1 else LocalPool(specs)
+    try:
+        restarts = []
+        for i, (spec, job) in enumerate(specs):
+            seeds = maketeams3.restart_seeds(job['seed'], job['count'])
+            chunksize = min(max(1, job['count'] // (n_workers * 4)), 4) # as in maketeams3.run
+            chunks = [seeds[c:c + chunksize] for c in range(0, len(seeds), chunksize)]
+            restarts.append([(chunk, pool.submit(_make_leagues, i, chunk)) for chunk in chunks])
+
+        bests = []
+        for i, (spec, job) in enumerate(specs):
+            best = maketeams3.BestLeagues(job['keep'])
+            for chunk, future in restarts[i]:
+                for seed, packed in zip(chunk, future.result()):
+                    best.add(seed, maketeams3.unpack_league(spec, packed))
+            bests.append(best)
+
+        reductions = [[pool.submit(_reduce_league, i, maketeams3.pack_league(league)) for league in best.leagues]
+                      for i, best in enumerate(bests)]
+        report = []
+        for i, (spec, job) in enumerate(specs):
+            reduced = [maketeams3.unpack_league(spec, future.result()) for future in reductions[i]]
+            league = write_job(job, spec, bests[i], reduced)
+            report.append({'players': job['players'],
+                           'file': job['file'],
+                           'seed': job['seed'],
+                           'happiness': bests[i].happiness,
+                           'ties': bests[i].ties,
+                           'kept': len(bests[i].leagues),
+                           'rating_range': maketeams3.team_rating_range(league['teams']),
+                           'done_seconds': time.perf_counter() - start})
+            print(f"{job['players']}: happiness {bests[i].happiness}, written to {job['file']}", file=sys.stderr)
+    except BaseException:
+        maketeams3._stop_workers(pool)
+        raise
+    pool.shutdown()
+    return report
+
+
+@click.command()
+@click.argument('manifest')
+@click.option('--jobs', default=1, type=click.IntRange(min=1), help='number of worker processes shared by all the jobs')
+@click.option('--report', default='batch.json', help='file to write the seed and results of each job to')
+def run(manifest, jobs, report):
+    results = run_batch(read_manifest(manifest), jobs)
+    with open(report, 'w') as outfile:
+        json.dump(results, outfile, indent=4)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,99 @@
+import click
+import random
+import json
+import time
+import os
+import io
+import sys
+import platform
+import tempfile
+import importlib
+
+from contextlib import redirect_stdout
+
+import maketeams3
+
+generate_test_data = importlib.import_module('generate-test-data')
+
+
+def timed(fun, *args, **kwargs):
+    start = time.perf_counter()
+    result = fun(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark(n_players, boards, restarts, engine, seed):
+    # seconds spent in each phase of a run on generated registrations
+    data = generate_test_data.generate_players(n_players, random.Random(seed))
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as outfile:
+        json.dump(data, outfile, indent=4)
+    try:
+        player_data, load = timed(maketeams3.get_player_data, outfile.name)
+    finally:
+        os.remove(outfile.name)
+
+    spec, compile_time = timed(maketeams3.compile_league, player_data, boards, 0.8)
+    leagues, make_time = timed(lambda: [maketeams3.make_league(spec, s)
+                                        for s in maketeams3.restart_seeds(seed, restarts)])
+    league = max(leagues, key=lambda l: maketeams3.total_happiness(l['teams']))
+    league['teams'], reduce_time = timed(maketeams3.reduce_variance, league['teams'], 200, engine)
+    with redirect_stdout(io.StringIO()):
+        _, output_time = timed(maketeams3.generate_print_output, league)
+
+    return {'players': n_players,
+            'boards': boards,
+            'teams': len(league['teams']),
+            'restarts': restarts,
+            'happiness': maketeams3.total_happiness(league['teams']),
+            'rating_range': maketeams3.team_rating_range(league['teams']),
+            'seconds': {'get_player_data': load,
+                        'compile_league': compile_time,
+                        'make_league': make_time / restarts,
+                        'reduce_variance': reduce_time,
+                        'generate_print_output': output_time}}
+
+
+def compare(results, previous):
+    # print how each phase changed against a previous report
+    old = {(r['players'], r['boards']): r['seconds'] for r in previous['results']}
+    for result in results:
+        before = old.get((result['players'], result['boards']))
+        if not before:
+            continue
+        changes = ", ".join(f"{phase} x{seconds / before[phase]:.2f}" for phase, seconds in result['seconds'].items()
+                            if before.get(phase))
+        print(f"{result['players']} players, {result['boards']} boards: {changes}")
+
+
+@click.command()
+@click.option('--sizes', default='100,1000,5000,20000', help='comma separated numbers of players.')
+@click.option('--boards', default='6', help='comma separated numbers of boards per team.')
+@click.option('--restarts', default=3, help='make_league runs timed per size.')
+@click.option('--engine', default='python', type=click.Choice(['python', 'numpy']))
+@click.option('--seed', default=0, help='seed for the generated data and the restarts.')
+@click.option('--report', default='benchmark.json', help='file to write the json report to.')
+@click.option('--compare-to', 'previous', default=None, help='an earlier report to compare against.')
+def run(sizes, boards, restarts, engine, seed, report, previous):
+    results = []
+    for n_players in [int(x) for x in sizes.split(',')]:
+        for n_boards in [int(x) for x in boards.split(',')]:
+            result = benchmark(n_players, n_boards, restarts, engine, seed)
+            seconds = ", ".join(f"{phase} {t:.3f}s" for phase, t in result['seconds'].items())
+            print(f"{n_players} players, {n_boards} boards: {seconds}", file=sys.stderr)
+            results.append(result)
+
+    with open(report, 'w') as outfile:
+        json.dump({'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'engine': engine,
+                   'seed': seed,
+                   'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'results': results}, outfile, indent=4)
+
+    if previous:
+        with open(previous) as infile:
+            compare(results, json.load(infile))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,79 @@
+"""Results of earlier runs, so rerunning on the same registrations with the same options is instant
+"""
+import hashlib
+import json
+import os
+import time
+
+SOURCES = ['maketeams3.py', 'names.py', 'numpy_engine.py', 'assignment.py']
+
+
+def default_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'lichess4545-teams')
+
+
+def code_version():
+    # a hash of the code that makes leagues, so results from older code are never used
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCES:
+        path = os.path.join(here, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as infile:
+                digest.update(infile.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # One json file per result, named by a hash of everything the result depends on. Entries from
+    # older code or inputs are never looked up again, so they are evicted: the least recently used
+    # beyond max_entries and any not used for max_age days.
+    def __init__(self, directory=None, max_entries=50, max_age=30):
+        self.directory = directory or default_dir()
+        self.max_entries = max_entries
+        self.max_age = max_age * 24 * 60 * 60
+
+    def key(self, path, params):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as infile:
+            digest.update(infile.read())
+        digest.update(code_version().encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as infile:
+                result = json.load(infile)
+        except (OSError, ValueError):
+            return None
+        os.utime(path) # now recently used
+        return result
+
+    def put(self, key, result):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp = self._path(key) + f'.{os.getpid()}.tmp'
+            with open(temp, 'w') as outfile:
+                json.dump(result, outfile)
+            os.replace(temp, self._path(key))
+            self.evict()
+        except OSError:
+            pass # a cache that can't be written just doesn't save any time
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                entries.append((os.path.getmtime(path), path))
+        entries.sort(reverse=True)
+        now = time.time()
+        for i, (used, path) in enumerate(entries):
+            if i >= self.max_entries or now - used > self.max_age:
+                os.remove(path)
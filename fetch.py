@@ -0,0 +1,171 @@
+"""Registrations from a heltour style paginated api, see maketeams3 --players URL
+"""
+import click
+import hashlib
+import http.client
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlparse, parse_qs
+
+from cache import default_dir
+
+
+def is_url(players):
+    return players.startswith(('http://', 'https://'))
+
+
+class Fetcher:
+    # GETs pages of {"count": total registrations, "results": [registration, ...]} from url with
+    # ?page=N&page_size=M. Each thread keeps one connection open to the server, failed requests
+    # are retried with backoff, and pages are kept on disk with their ETag so an unchanged page
+    # is answered with a 304 and not sent again
+    def __init__(self, url, page_size=100, workers=4, retries=4, cache_dir=None):
+        self.url = urlparse(url)
+        self.page_size = page_size
+        self.workers = workers
+        self.retries = retries
+        self.cache_dir = cache_dir or os.path.join(default_dir(), 'pages')
+        self.local = threading.local()
+
+    def connection(self, fresh=False):
+        if fresh or getattr(self.local, 'connection', None) is None:
+            kind = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+            self.local.connection = kind(self.url.netloc, timeout=30)
+        return self.local.connection
+
+    def cached(self, path):
+        name = hashlib.sha256(f"{self.url.netloc}{path}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, name + '.json')
+
+    def get(self, page):
+        query = dict(parse_qs(self.url.query), page=page, page_size=self.page_size)
+        path = f"{self.url.path or '/'}?{urlencode(query, doseq=True)}"
+        cache_file = self.cached(path)
+        try:
+            with open(cache_file) as infile:
+                cached = json.load(infile)
+        except (OSError, ValueError):
+            cached = None
+        headers = {'Accept': 'application/json'}
+        if cached:
+            headers['If-None-Match'] = cached['etag']
+
+        for attempt in range(self.retries + 1):
+            try:
+                connection = self.connection(fresh=attempt > 0)
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status == 304 and cached:
+                    return cached['body']
+                if response.status == 200:
+                    body = json.loads(body)
+                    etag = response.getheader('ETag')
+                    if etag:
+                        os.makedirs(self.cache_dir, exist_ok=True)
+                        with open(cache_file, 'w') as outfile:
+                            json.dump({'etag': etag, 'body': body}, outfile)
+                    return body
+                if response.status not in (429, 500, 502, 503, 504) or attempt == self.retries:
+                    raise OSError(f"GET {path} returned {response.status}")
+            time.sleep(0.1 * 2 ** attempt * (1 + random.random()))
+
+    def players(self):
+        # registrations in order, a page at a time as they arrive. The first page says how many
+        # pages there are, the rest are fetched concurrently
+        first = self.get(1)
+        yield from first['results']
+        pages = math.ceil(first['count'] / self.page_size)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for results in executor.map(lambda page: self.get(page)['results'], range(2, pages + 1)):
+                yield from results
+
+
+def fetch_players(url, **options):
+    # the same records get_player_data reads from an exported file
+    return list(Fetcher(url, **options).players())
+
+
+class PagesHandler(BaseHTTPRequestHandler):
+    # a stand in for the league site serving a registration file: GET /?page=N&page_size=M, with
+    # ETags, and failing at random when the server is flaky
+    protocol_version = 'HTTP/1.1' # keeps connections open between pages
+
+    def do_GET(self):
+        if random.random() < self.server.flaky:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        query = parse_qs(urlparse(self.path).query)
+        page = int(query.get('page', ['1'])[-1])
+        size = int(query.get('page_size', ['100'])[-1])
+        players = self.server.players
+        body = json.dumps({'count': len(players), 'results': players[(page - 1) * size:page * size]}).encode()
+        etag = '"{}"'.format(hashlib.sha256(body).hexdigest()[:16])
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument('url')
+@click.option('--output', default='-', help='file to write the registrations to (stdout by default)')
+@click.option('--page-size', default=100)
+@click.option('--workers', default=4, help='pages fetched at the same time')
+def get(url, output, page_size, workers):
+    # export the registrations at url the way get_player_data reads them
+    players = fetch_players(url, page_size=page_size, workers=workers)
+    with click.open_file(output, 'w') as outfile:
+        json.dump(players, outfile, indent=4)
+
+
+@cli.command()
+@click.argument('players')
+@click.option('--port', default=8046)
+@click.option('--flaky', default=0.0, help='proportion of requests to fail with a 503')
+def serve(players, port, flaky):
+    # serve a registration file as pages, for trying out and testing get
+    server = ThreadingHTTPServer(('127.0.0.1', port), PagesHandler)
+    with open(players) as infile:
+        server.players = json.load(infile)
+    server.flaky = flaky
+    print(f"Serving {players} on http://127.0.0.1:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    cli()
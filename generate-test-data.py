@@ -0,0 +1,90 @@
+import click
+import random
+import json
+import datetime
+
+SYLLABLES = ['ka', 'ro', 'mi', 'chess', 'pawn', 'knight', 'zu', 'lo', 'tar', 'vin', 'el', 'qu', 'bish',
+             'rook', 'gam', 'bit', 'no', 'xa', 'de', 'fi']
+SEPARATORS = [', ', ',', ' ', ' and ', '\n', '; ', ' / ']
+
+
+def make_names(n, rng):
+    # unique (ignoring case) lichess style usernames
+    names = []
+    seen = set()
+    while len(names) < n:
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+        name = rng.choice([name, name.capitalize(), name.upper()])
+        if rng.random() < 0.6:
+            name += rng.choice(['', '_', '-']) + str(rng.randint(0, 9999))
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return names
+
+
+def mention(name, rng):
+    # how people write a name in the friends/avoid boxes
+    return rng.choice([name, name, name.lower(), '@' + name])
+
+
+def write_names(names, rng):
+    if not names:
+        return rng.choice(['', '', 'none', 'n/a'])
+    text = mention(names[0], rng)
+    for name in names[1:]:
+        text += rng.choice(SEPARATORS) + mention(name, rng)
+    return text
+
+
+def generate_players(n, rng, friend_groups=0.6, avoid_rate=0.05, alt_rate=0.08):
+    # registrations in the get_player_data format. Friends mostly come in small groups of
+    # players of any rating who all name each other, some names are misspelt or not registered
+    names = make_names(n, rng)
+    ratings = [int(min(2700, max(800, rng.gauss(1700, 300)))) for _ in range(n)]
+    friends = [[] for _ in range(n)]
+    order = list(range(n))
+    rng.shuffle(order)
+    i = 0
+    while i < n * friend_groups:
+        group = order[i:i + rng.choice([2, 2, 2, 3, 3, 4, 5])]
+        for member in group:
+            friends[member] = [names[other] for other in group if other != member and rng.random() < 0.85]
+        i += len(group)
+    for player in friends:
+        if player and rng.random() < 0.05:
+            player[0] = player[0][:-1] # a typo
+        if rng.random() < 0.03:
+            player.append(rng.choice(SYLLABLES) + 'notregistered')
+
+    start = datetime.datetime(2020, 1, 1)
+    players = []
+    for i, name in enumerate(names):
+        avoid = [names[rng.randrange(n)] for _ in range(rng.randint(1, 2))] if rng.random() < avoid_rate else []
+        players.append({
+            'name': name,
+            'rating': ratings[i],
+            'in_slack': rng.random() < 0.97,
+            'has_20_games': rng.random() < 0.97,
+            'account_status': 'normal',
+            'date_created': (start + datetime.timedelta(minutes=rng.randrange(60 * 24 * 28))).isoformat(),
+            'prefers_alt': rng.random() < alt_rate,
+            'previous_season_alternate': 'alternate' if rng.random() < 0.1 else 'full_time',
+            'friends': write_names(friends[i], rng),
+            'avoid': write_names([a for a in avoid if a != name], rng),
+        })
+    return players
+
+
+@click.command()
+@click.option('--players', default=600, help='number of registrations to generate.')
+@click.option('--seed', type=int, default=None, help='seed for reproducible data')
+@click.option('--output', default='-', help='file to write the json to (stdout by default)')
+def run(players, seed, output):
+    data = generate_players(players, random.Random(seed))
+    with click.open_file(output, 'w') as outfile:
+        json.dump(data, outfile, indent=4)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,21 +1,32 @@
 import click
 import random
 import json
-import re
 import time
 import math
+import os
 import sys
 import terminal
 import csv
+import heapq
+import signal
+import threading
 
-from itertools import combinations
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, islice
 from functools import partial
 
+from assignment import min_cost_assignment
+from cache import ResultCache
+from fetch import fetch_players, is_url
+from names import NameIndex
+from snapshot import load_snapshot, snapshot_path, write_snapshot
+from stats import Stats
+
 class Player:
-    pref_score = 0
-    team = None
-    board = None
-    req_met = False
+    # a restart builds a full set of these (see build_players), slots keep them small
+    __slots__ = ('name', 'rating', 'friends', 'avoid', 'date', 'alt', 'previous_season_alt', 'linked',
+                 'pref_score', 'team', 'board', 'req_met', 'id')
     def __init__(self, name, rating, friends, avoid, date, alt, previous_season_alt):
         self.name = name
         self.rating = rating
@@ -24,6 +35,12 @@ class Player:
         self.date = date
         self.alt = alt
         self.previous_season_alt = previous_season_alt
+        self.linked = set() #players that list this player as a friend or avoid
+        self.pref_score = 0
+        self.team = None
+        self.board = None
+        self.req_met = False
+        self.id = None #index in LeagueSpec.players, set by build_players
 
     @classmethod
     def player_from_json(cls, player):
@@ -41,28 +58,47 @@ class Player:
         return str((self.name, self.board, self.rating, self.req_met))
     def __lt__(self, other):
         return True
+    def prefScoreOn(self, boards):
+        #preference score this player would have on a team made up of boards
+        pref_score = 0
+        for friend in self.friends:
+            if friend in boards:
+                pref_score += 1
+            else:
+                pref_score -= 1
+        for avoid in self.avoid:
+            if avoid in boards:
+                pref_score -= 1
+        return pref_score
     def setPrefScore(self):
-        self.pref_score = 0
+        #same as prefScoreOn(self.team.getBoards()): a player is on a team's boards exactly when
+        #their team is that team, which is quicker to check than searching the boards
+        team = self.team
+        pref_score = 0
         for friend in self.friends:
-            if friend in self.team.getBoards():
-                self.pref_score += 1
+            if friend.team is team:
+                pref_score += 1
             else:
-                self.pref_score -= 1
+                pref_score -= 1
         for avoid in self.avoid:
-            if avoid in self.team.getBoards():
-                self.pref_score -= 1
+            if avoid.team is team:
+                pref_score -= 1
+        self.pref_score = pref_score
         #player with more than 5 choices can be <5 preference even if all teammates are preferred
     def setReqMet(self):
         self.req_met = False
         if not self.friends:
             self.req_met = None
         for friend in self.friends:
-            if friend in self.team.getBoards():
+            if friend.team is self.team:
                 self.req_met = True
 
 class Team:
+    __slots__ = ('boards', 'rating_sum', 'team_pref_score')
     def __init__(self, boards):
         self.boards = [None for x in range(boards)]
+        self.rating_sum = 0 #kept up to date by changeBoard
+        self.team_pref_score = 0 #kept up to date by updatePref
     def __str__(self):
         return str((self.boards, self.team_pref_score, self.getMean()))
     def __repr__(self):
@@ -73,13 +109,15 @@ class Team:
         #updates the player on a board and updates that player's team attribute
         if self.boards[board]:
             self.boards[board].team = None
+            self.rating_sum -= self.boards[board].rating
         self.boards[board] = new_player
+        self.rating_sum += new_player.rating
         if new_player.team:
             new_player.team.boards[board] = None
+            new_player.team.rating_sum -= new_player.rating
         new_player.team = self
     def getMean(self):
-        ratings = [board.rating for board in self.boards]
-        mean = sum(ratings) / len(ratings)
+        mean = self.rating_sum / len(self.boards)
         return mean
     def getBoards(self):
         return self.boards
@@ -94,9 +132,102 @@ def updatePref(players, teams): #update preference scores
     for team in teams:
         team.setTeamPrefScore()
 
+def swapPlayers(teama, playera, teamb, playerb, board):
+    #swap players between teams - ensure players are same board for input
+    teama.changeBoard(board,playerb)
+    teamb.changeBoard(board,playera)
+
+def testSwap(teama, playera, teamb, playerb, board):
+    #return the preference change if this swap was made, without making it. Only players on the
+    #two teams can change score: the swapped players and their teammates linked to either of them
+    if teama is teamb:
+        return 0
+    new_a = [playerb if p is playera else p for p in teama.boards]
+    new_b = [playera if p is playerb else p for p in teamb.boards]
+    change = playera.prefScoreOn(new_b) - playera.pref_score
+    change += playerb.prefScoreOn(new_a) - playerb.pref_score
+    for mate in playera.linked | playerb.linked:
+        if mate.team is teama and mate is not playera:
+            change += mate.prefScoreOn(new_a) - mate.pref_score
+        elif mate.team is teamb and mate is not playerb:
+            change += mate.prefScoreOn(new_b) - mate.pref_score
+    return change #more positive = better swap
+
+def linkChange(mate, player):
+    #how mate's preference score changes when player joins mate's team (the negative when they leave)
+    return 2 * mate.friends.count(player) - mate.avoid.count(player)
+
+def moveScores(player, teams):
+    #testSwap for swapping player with their board on each of teams, in order. The scores are split
+    #the way testSwap's players are: what player and those linking to it gain on each team is counted
+    #once for all teams, and the player swapped back only adds anything if they list or are listed by
+    #someone. Players on the same board never list each other, so the parts just add up
+    team_a, board = player.team, player.board
+    arriving = Counter()
+    leaving = 0
+    for friend in player.friends:
+        arriving[friend.team] += 2
+    for avoid in player.avoid:
+        arriving[avoid.team] -= 1
+    for mate in player.linked:
+        arriving[mate.team] += linkChange(mate, player)
+        if mate.team is team_a:
+            leaving += linkChange(mate, player)
+    base = -len(player.friends) - player.pref_score - leaving
+
+    scores = []
+    for team in teams:
+        if team is team_a:
+            scores.append(0)
+            continue
+        score = base + arriving[team]
+        other = team.boards[board]
+        if other.friends or other.avoid or other.linked:
+            score -= len(other.friends) + other.pref_score
+            for friend in other.friends:
+                if friend.team is team_a:
+                    score += 2
+            for avoid in other.avoid:
+                if avoid.team is team_a:
+                    score -= 1
+            for mate in other.linked:
+                if mate.team is team_a:
+                    score += linkChange(mate, other)
+                elif mate.team is team:
+                    score -= linkChange(mate, other)
+        scores.append(score)
+    return scores
+
+def playerSortKey(player):
+    return (player.team.team_pref_score, player.pref_score)
+
+def teamSortKey(team):
+    return team.team_pref_score
+
 def updateSort(players, teams): #based on preference score high to low
-    players.sort(key=lambda player: (player.team.team_pref_score, player.pref_score), reverse = False)
-    teams.sort(key=lambda team: team.team_pref_score, reverse = False)
+    players.sort(key=playerSortKey, reverse = False)
+    teams.sort(key=teamSortKey, reverse = False)
+
+class StableOrder:
+    #ranks items the way repeated stable sorts by key would order them, starting from their current
+    #order, so that only items whose key changed need repositioning. A rank is (key, tiebreak)
+    def __init__(self, items, key):
+        self.key = key
+        self.rank = {item: (key(item), i) for i, item in enumerate(items)}
+        self.low = 0
+        self.high = len(self.rank)
+    def update(self, items):
+        #a stable sort puts an item whose key went up before the items that already had its new key,
+        #and one whose key went down after them, in the order the moved items were in before
+        moved = sorted((self.rank[item], item) for item in set(items) if self.key(item) != self.rank[item][0])
+        for rank, item in reversed(moved):
+            if self.key(item) > rank[0]:
+                self.low -= 1
+                self.rank[item] = (self.key(item), self.low)
+        for rank, item in moved:
+            if self.key(item) < rank[0]:
+                self.rank[item] = (self.key(item), self.high)
+                self.high += 1
 
 def split_into_equal_groups_by_rating(players, group_number):
     players.sort(key=lambda player: player.rating, reverse=True)
@@ -145,40 +276,154 @@ def flatten(lst):
 
 
 @click.command()
-@click.option('--output', default="readable", type=click.Choice(['json', 'readable']))
-@click.option('--players', help='the json file containing the players.', required=True)
+@click.option('--output', default="readable", type=click.Choice(['json', 'readable']), help='json prints only the heltour upload of the chosen league')
+@click.option('--happy-leagues', 'happy_file', default=None, help='write the happy leagues to this file instead of printing them (one json upload per line with --output json)')
+@click.option('--players', help='the json file containing the players, or the url of the registrations.', required=True)
 @click.option('--boards', default=6, help='number of boards per team.')
 @click.option('--balance', default=0.8, help='proportion of all players that will be full time')
-@click.option('--count', default=100, help='Number of iterations to run happiness optimizer')
-def run(players, output, boards, balance, count):
-    player_data = get_player_data(players)
+@click.option('--count', type=int, default=None, help='Number of iterations to run happiness optimizer (default 100, or 1 with --optimizer anneal)')
+@click.option('--seed', type=int, default=None, help='seed for the random restarts (random if not given)')
+@click.option('--jobs', default=1, type=click.IntRange(min=1), help='number of worker processes to run the restarts on')
+@click.option('--variance-iterations', default=200, help='most swaps made when reducing rating variance (0 to run until no swap helps)')
+@click.option('--balance-boards', is_flag=True, help='rebalance each board as an assignment problem, keeping happiness, before the variance swaps (quicker, and usually a lower rating range on large leagues)')
+@click.option('--engine', default='python', type=click.Choice(['python', 'numpy']), help='numpy runs the variance swaps with numpy, which needs to be installed')
+@click.option('--keep', default=100, help='most leagues of the best happiness to keep (0 for no limit)')
+@click.option('--time-limit', type=float, default=None, help='keep making leagues for this many seconds instead of --count')
+@click.option('--optimizer', default='climb', type=click.Choice(['climb', 'anneal']), help='anneal starts each league with simulated annealing')
+@click.option('--anneal-steps', default=0, help='swaps tried per annealed league (default 200 per player)')
+@click.option('--variance-weight', default=0.03, help='happiness worth one unit of team rating variance when annealing')
+@click.option('--stats', 'stats_file', default=None, help='write timings and counters for the run to this json file')
+@click.option('--profile', 'profile_file', default=None, help='write cProfile stats for the run to this file')
+@click.option('--previous', 'previous_file', default=None, help='heltour json of an earlier run to repair for changed registrations instead of starting again')
+@click.option('--no-cache', is_flag=True, help="don't reuse or save the result of an earlier run with the same input and options")
+def run(players, output, happy_file, boards, balance, count, seed, jobs, variance_iterations, balance_boards, engine, keep, time_limit,
+        optimizer, anneal_steps, variance_weight, stats_file, profile_file, previous_file, no_cache):
+    if stats_file:
+        start_stats(engine)
+        click.get_current_context().call_on_close(lambda: _stats.write(stats_file))
+    if profile_file:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        click.get_current_context().call_on_close(lambda: profiler.dump_stats(profile_file))
+
+    player_data, names = read_players(players)
+    previous = read_previous(previous_file) if previous_file else {}
+    spec = compile_league(player_data, boards, balance, names, placed=previous)
+
+    info = sys.stderr if output == 'json' else sys.stdout # keeps stdout to the upload itself
+    if previous:
+        if seed is None:
+            seed = random.randrange(2**32)
+        print(f"Using seed {seed}", file=info)
+        league = repair_league(spec, previous, seed)
+        print(f"{len(spec.players) - len(league['moved'])} players kept their teams, {len(league['moved'])} were placed",
+              file=info)
+        write_league(league, sys.stdout, output)
+        return
+
+    if count is None:
+        count = 1 if optimizer == 'anneal' else 100
+
+    # a run without --seed reuses whatever seed the last one like it used. Time limited runs
+    # depend on the speed of the machine, so they are never cached, nor are registrations fetched
+    # from the league site
+    results = cache_key = None
+    if not (no_cache or time_limit or is_url(players)):
+        results = ResultCache()
+        params = {'boards': boards, 'balance': balance, 'count': count, 'variance_iterations': variance_iterations,
+                  'balance_boards': balance_boards, 'engine': engine, 'keep': keep, 'optimizer': optimizer,
+                  'anneal_steps': anneal_steps, 'variance_weight': variance_weight}
+        cache_key = lambda seed: results.key(players, dict(params, seed=seed))
+        cached = results.get(cache_key(seed))
+        if cached:
+            print(f"Using seed {cached['seed']} (cached result)", file=info)
+            happy = cached['happy']
+            print(f"{cached['ties']} leagues of happiness {cached['happiness']} found, {len(happy)} different ones kept",
+                  file=info)
+            print_results((unpack_league(spec, packed) for packed in happy), unpack_league(spec, cached['balanced']),
+                          output, happy_file)
+            return
+
+    if seed is None:
+        seed = random.randrange(2**32)
+    print(f"Using seed {seed}", file=info)
+
+    options = {}
+    if optimizer == 'anneal':
+        options['anneal_steps'] = anneal_steps or 200 * len(spec.players)
+        options['variance_weight'] = variance_weight
+    best = BestLeagues(keep)
+    if time_limit:
+        leagues = make_leagues(spec, iter_seeds(seed), jobs, **options)
+    else:
+        chunksize = min(max(1, count // (jobs * 4)), 4) # small enough for an interrupt to stop quickly
+        leagues = make_leagues(spec, restart_seeds(seed, count), jobs, chunksize, **options)
+    progress = Progress(time_limit)
+    interrupted = False
+    try:
+        for league_seed, league in leagues:
+            improved = best.add(league_seed, league)
+            progress.update(best, improved)
+            if progress.finished():
+                break
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted, carrying on with the best leagues found so far", file=sys.stderr)
+    finally:
+        leagues.close()
+    if best.happiness is None:
+        print("No leagues were made", file=info)
+        return
+
+    happy_leagues = best.leagues
+    print(f"{best.ties} leagues of happiness {best.happiness} found, {len(happy_leagues)} different ones kept", file=info)
+    happy = [pack_league(league) for league in happy_leagues]
+    try:
+        happy_leagues = reduce_leagues(spec, happy_leagues, jobs, variance_iterations=variance_iterations,
+                                       balance_boards=balance_boards, engine=engine)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted, carrying on without reducing rating variance", file=sys.stderr)
+        happy_leagues = [unpack_league(spec, packed) for packed in happy] # some may be part way reduced
+    min_range_league = min(happy_leagues, key=lambda l: team_rating_range(l['teams']))
 
-    leagues = [make_league(player_data, boards, balance) for _ in range(count)]
+    if cache_key and not interrupted:
+        result = {'seed': seed, 'ties': best.ties, 'happiness': best.happiness, 'happy': happy,
+                  'balanced': pack_league(min_range_league)}
+        results.put(cache_key(seed), result)
+        results.put(cache_key(None), result)
+    print_results((unpack_league(spec, packed) for packed in happy), min_range_league, output, happy_file)
 
-    max_happiness = max([total_happiness(l['teams']) for l in leagues])
-    happy_leagues = [l for l in leagues if total_happiness(l['teams']) == max_happiness]
-    print(f"{len(happy_leagues)} leagues of happiness {max_happiness} found")
 
-    for i, league in enumerate(happy_leagues):
-        print(f"Happy League {i}")
-        generate_print_output(league)
+def print_results(happy_leagues, min_range_league, output='readable', happy_file=None):
+    # happy_leagues are written out one at a time as they come, to happy_file if given. Only
+    # readable output prints them along with the chosen league
+    if happy_file:
+        with click.open_file(happy_file, 'w') as outfile:
+            for i, league in enumerate(happy_leagues):
+                write_league(league, outfile, output, f"Happy League {i}")
+    elif output == 'readable':
+        for i, league in enumerate(happy_leagues):
+            write_league(league, sys.stdout, output, f"Happy League {i}")
 
-    for league in happy_leagues:
-        league['teams'] = reduce_variance(league['teams'])
+    write_league(min_range_league, sys.stdout, output, "Minimum rating range happy league")
 
-    min_range_league = min(happy_leagues, key=lambda l: team_rating_range(l['teams']))
-    print("Minimum rating range happy league")
-    generate_print_output(min_range_league)
 
-    # if output == "readable":
-    #
-    # elif output == "json":
-    #     print(json.dumps(generate_json_output_object()))
+def write_league(league, outfile, output='readable', title=None):
+    # a league in one write: readable tables under a title, or a line of heltour json
+    if output == 'json':
+        outfile.write(json.dumps(generate_json_output_object(league['teams'], league['alts_split'])) + "\n")
+    else:
+        outfile.write((f"{title}\n" if title else "") + render_league(league))
 
 
 def get_player_data(players):
     # input file is JSON data with the following keys: rating, name, in_slack, account_status, date_created,
-    # prefers_alt, friends, avoid, has_20_games.
+    # prefers_alt, friends, avoid, has_20_games. players can also be the url of the league site's
+    # registrations, see fetch.py
+    if is_url(players):
+        return fetch_players(players)
     with open(players,'r') as infile:
         playerdata = json.load(infile)
     return playerdata
@@ -188,7 +433,263 @@ def get_player_data(players):
     # put player data into Player objects
 
 
-def make_league(playerdata, boards, balance):
+def read_players(players):
+    # the player data and a NameIndex of it. While the json is unchanged, a snapshot of it compiled
+    # by snapshot.py is loaded instead, and a snapshot of an older version is compiled again
+    loaded = load_snapshot(players)
+    if loaded:
+        return loaded
+    player_data = get_player_data(players)
+    names = NameIndex(p['name'] for p in player_data)
+    if os.path.exists(snapshot_path(players)):
+        try:
+            write_snapshot(players, player_data, names)
+        except OSError:
+            pass # the json was read anyway, the next run tries again
+    return player_data, names
+
+
+class Registrations:
+    # A registration file parsed once, with names resolved once (NameIndex caches every friends
+    # and avoid string it has seen) and a LeagueSpec compiled once per (boards, balance)
+    def __init__(self, path):
+        self.player_data, self.names = read_players(path)
+        self.specs = {}
+        self.lock = threading.Lock()
+
+    def spec(self, boards, balance):
+        with self.lock:
+            if (boards, balance) not in self.specs:
+                self.specs[boards, balance] = compile_league(self.player_data, boards, balance, self.names)
+            return self.specs[boards, balance]
+
+
+def read_previous(path):
+    # {lower case name: (team index, board index)} for the team members in a heltour upload made
+    # by generate_json_output_object
+    with open(path) as infile:
+        actions = json.load(infile)
+    return {action['player']['name'].lower(): (action['team_number'] - 1, action['board_number'] - 1)
+            for action in actions if action['action'] == 'change-member'}
+
+
+def iter_seeds(seed):
+    # each restart gets its own seed so results don't depend on how restarts are spread over workers
+    rng = random.Random(seed)
+    while True:
+        yield rng.getrandbits(32)
+
+
+def restart_seeds(seed, count):
+    return list(islice(iter_seeds(seed), count))
+
+
+_stats = None
+
+def start_stats(engine='python'):
+    # time and count the phases of a run from here on, see stats.Stats
+    global _stats
+    _stats = Stats()
+    module = sys.modules[__name__]
+    _stats.wrap(module, 'read_players', timer='parse')
+    _stats.wrap(NameIndex, 'positions', timer='name resolution')
+    _stats.wrap(module, 'compile_league', timer='compile_league')
+    _stats.wrap(module, 'make_league', timer='make_league', counter='restarts')
+    _stats.wrap(module, 'anneal', timer='anneal')
+    _stats.wrap(module, 'hill_climb', timer='swap loop')
+    _stats.wrap(module, 'testSwap', timer='testSwap', counter='swaps tested')
+    _stats.wrap(module, 'moveScores', counter='swaps tested', amount=lambda player, teams: len(teams))
+    _stats.wrap(module, 'swapPlayers', counter='swaps accepted')
+    _stats.wrap(module, 'updatePref', timer='updatePref', counter='updatePref calls')
+    _stats.wrap(module, 'reduce_variance', timer='reduce_variance')
+    _stats.wrap(module, 'balance_teams', timer='balance_teams')
+    _stats.wrap(module, 'perform_swap', counter='reduce_variance iterations')
+    _stats.wrap(SwapIndex, 'add', counter='neutral swaps generated', amount=lambda index, swaps: len(swaps))
+    _stats.wrap(module, 'render_league', timer='output')
+    if engine == 'numpy':
+        import numpy_engine
+        _stats.wrap(numpy_engine, 'reduce_variance', timer='reduce_variance')
+
+
+_worker_league = None
+
+def _start_worker(spec, options, collect_stats):
+    # the spec is sent once per worker rather than with every task, with the options for
+    # make_league or reduce_league. Interrupts are left to the main process, which stops handing
+    # out restarts
+    global _worker_league
+    _worker_league = (spec, options)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if collect_stats:
+        if _stats is None: # not forked from an instrumented process
+            start_stats(options.get('engine', 'python'))
+        _stats.take()
+
+def _make_worker_leagues(seeds):
+    spec, options = _worker_league
+    leagues = [pack_league(make_league(spec, seed, **options)) for seed in seeds]
+    return leagues, _stats.take() if _stats else None
+
+
+def _reduce_worker_leagues(packed_leagues):
+    spec, options = _worker_league
+    leagues = [pack_league(reduce_league(unpack_league(spec, packed), **options)) for packed in packed_leagues]
+    return leagues, _stats.take() if _stats else None
+
+
+def _stop_workers(executor):
+    # drops the tasks not yet started and kills the workers rather than waiting for the ones they
+    # are part way through, which could be whole chunks of restarts. The workers are only reachable
+    # through _processes, a CPython internal; without it they are left to finish their tasks
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def reduce_league(league, variance_iterations=200, balance_boards=False, engine='python'):
+    if balance_boards:
+        league['teams'] = balance_teams(league['teams'])
+    league['teams'] = reduce_variance(league['teams'], variance_iterations, engine)
+    return league
+
+
+def reduce_leagues(spec, leagues, jobs=1, **options):
+    # reduce_league for each of leagues, which are all different (see BestLeagues), spread over
+    # jobs worker processes. Returns the reduced leagues in the same order
+    if jobs <= 1 or len(leagues) <= 1:
+        return [reduce_league(league, **options) for league in leagues]
+    chunks = [leagues[i::jobs] for i in range(jobs)]
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=_start_worker,
+                                   initargs=(spec, options, _stats is not None))
+    try:
+        futures = [executor.submit(_reduce_worker_leagues, [pack_league(league) for league in chunk])
+                   for chunk in chunks if chunk]
+        reduced = []
+        for future in futures:
+            packed_leagues, worker_stats = future.result()
+            if worker_stats:
+                _stats.merge(worker_stats)
+            reduced.append([unpack_league(spec, packed) for packed in packed_leagues])
+    except BaseException:
+        _stop_workers(executor)
+        raise
+    executor.shutdown()
+    return [reduced[i % jobs][i // jobs] for i in range(len(leagues))]
+
+
+def make_leagues(spec, seeds, jobs=1, chunksize=1, **options):
+    # yields (seed, league) for each seed in order, as they are made. seeds may be endless, only
+    # a couple of chunks per worker are handed out ahead of the one being yielded. options are
+    # passed on to make_league
+    if jobs <= 1:
+        for seed in seeds:
+            yield seed, make_league(spec, seed, **options)
+        return
+    seeds = iter(seeds)
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=_start_worker,
+                                   initargs=(spec, options, _stats is not None))
+
+    def submit():
+        chunk = list(islice(seeds, chunksize))
+        if chunk:
+            pending.append((chunk, executor.submit(_make_worker_leagues, chunk)))
+
+    try:
+        for _ in range(jobs * 2):
+            submit()
+        while pending:
+            chunk, future = pending.popleft()
+            submit()
+            leagues, worker_stats = future.result()
+            if worker_stats:
+                _stats.merge(worker_stats)
+            for seed, packed in zip(chunk, leagues):
+                yield seed, unpack_league(spec, packed)
+    finally:
+        if pending: # stopped early, by a time limit, an interrupt or an error
+            _stop_workers(executor)
+        else:
+            executor.shutdown()
+
+
+class Progress:
+    # reports restarts/sec and the best league so far while running against a time limit
+    def __init__(self, time_limit=None, every=5.0):
+        self.time_limit = time_limit
+        self.every = every
+        self.start = self.last = time.time()
+        self.restarts = 0
+
+    def update(self, best, improved):
+        self.restarts += 1
+        now = time.time()
+        if self.time_limit and (improved or now - self.last >= self.every):
+            self.last = now
+            rating_range = min(team_rating_range(l['teams']) for l in best.leagues)
+            print(f"{now - self.start:.0f}s: {self.restarts} restarts ({self.restarts / (now - self.start):.1f}/s), "
+                  f"best happiness {best.happiness}, rating range {rating_range:.2f}", file=sys.stderr)
+
+    def finished(self):
+        return bool(self.time_limit) and time.time() - self.start >= self.time_limit
+
+
+def league_key(league):
+    # the same for leagues with the same teams, whatever order the teams are in
+    return tuple(sorted(tuple(player.name for player in team.boards) for team in league['teams']))
+
+
+class BestLeagues:
+    # Keeps the leagues with the best happiness seen so far, at most keep of them (0 for no
+    # limit), dropping leagues with the same teams as one already kept. The seed and happiness of
+    # every restart are remembered so any league can be rebuilt with make_league(spec, seed).
+    def __init__(self, keep=0):
+        self.keep = keep
+        self.scores = []
+        self.happiness = None
+        self.ties = 0
+        self.leagues = []
+        self.keys = set()
+
+    def add(self, seed, league):
+        # returns whether this is a new best happiness
+        happiness = total_happiness(league['teams'])
+        self.scores.append((seed, happiness))
+        improved = self.happiness is None or happiness > self.happiness
+        if improved:
+            self.happiness = happiness
+            self.ties = 0
+            self.leagues = []
+            self.keys = set()
+        if happiness == self.happiness:
+            self.ties += 1
+            key = league_key(league)
+            if key not in self.keys and (not self.keep or len(self.leagues) < self.keep):
+                self.keys.add(key)
+                self.leagues.append(league)
+        return improved
+
+    def seeds(self, happiness=None):
+        # seeds of the restarts that reached happiness (the best by default)
+        if happiness is None:
+            happiness = self.happiness
+        return [seed for seed, h in self.scores if h == happiness]
+
+
+# Everything about a league that doesn't depend on the random shuffle, worked out once per run.
+# Players are stored as Player constructor arguments, and board splits, alternates and
+# friends/avoid as tuples of indexes into those, so each restart can cheaply build its own objects.
+LeagueSpec = namedtuple('LeagueSpec', ['boards', 'num_teams', 'players', 'players_split', 'friends',
+                                       'avoid', 'team_rating_bounds', 'alternates', 'alts_split',
+                                       'alt_rating_bounds'])
+
+
+def compile_league(playerdata, boards, balance, names=None, placed=()):
+    # players named in placed (lower case) already have a team, so they are the last to become
+    # alternates when there are too many players
+    if names is None:
+        names = NameIndex(p['name'] for p in playerdata)
 
     players = []
     for player in playerdata:
@@ -212,7 +713,8 @@ def make_league(playerdata, boards, balance):
 
     # separate latest joining players into alternate lists as required
     for n, board in enumerate(players_split):
-        board.sort(key=lambda player: (0 if player.previous_season_alt else 1, player.date))
+        board.sort(key=lambda player: (player.name.lower() not in placed,
+                                       0 if player.previous_season_alt else 1, player.date))
         alternates.extend(board[num_teams:])
         del board[num_teams:]
         board.sort(key=lambda player: player.rating, reverse=True)
@@ -230,19 +732,92 @@ def make_league(playerdata, boards, balance):
         for player in board:
             player.board = n
 
-    def convert_name_list(string_of_names, players):
-        pattern = r"([^-_a-zA-Z0-9]|^){0}([^-_a-zA-Z0-9]|$)"
-        return [player for player in players
-                if re.search(pattern.format(player.name), string_of_names, flags=re.I)]
+    # requests for players on the same board can never be met, so they are dropped
+    positions = {}
+    for i, player in enumerate(players):
+        positions.setdefault(player.name, []).append(i)
+
+    def convert_name_list(string_of_names, board):
+        found = names.resolve(string_of_names)
+        return tuple(sorted(i for name in found for i in positions.get(name, ())
+                            if players[i].board != board))
+
+    def record(player):
+        return (player.name, player.rating, player.friends, player.avoid, player.date, player.alt,
+                player.previous_season_alt)
+
+    index = {id(player): i for i, player in enumerate(players)}
+    alt_index = {id(player): i for i, player in enumerate(alternates)}
+    return LeagueSpec(
+        boards=boards,
+        num_teams=num_teams,
+        players=tuple(record(p) for p in players),
+        players_split=tuple(tuple(index[id(p)] for p in board) for board in players_split),
+        friends=tuple(convert_name_list(p.friends, p.board) for p in players),
+        avoid=tuple(convert_name_list(p.avoid, p.board) for p in players),
+        team_rating_bounds=tuple(team_rating_bounds),
+        alternates=tuple(record(p) for p in alternates),
+        alts_split=tuple(tuple(alt_index[id(p)] for p in board) for board in alts_split),
+        alt_rating_bounds=tuple(alt_rating_bounds))
+
+
+def build_players(spec):
+    # fresh Player objects for a league, player.id is the player's index in spec.players
+    players = [Player(*record) for record in spec.players]
+    for i, player in enumerate(players):
+        player.id = i
+    for player, friends, avoid in zip(players, spec.friends, spec.avoid):
+        player.friends = [players[i] for i in friends]
+        player.avoid = [players[i] for i in avoid]
+    for player in players:
+        for other in player.friends + player.avoid:
+            other.linked.add(player)
+    players_split = [[players[i] for i in board] for board in spec.players_split]
+    for n, board in enumerate(players_split):
+        for player in board:
+            player.board = n
+
+    alternates = [Player(*record) for record in spec.alternates]
+    alts_split = [[alternates[i] for i in board] for board in spec.alts_split]
+    return players, players_split, alternates, alts_split
 
+
+def pack_league(league):
+    # a league made by make_league as player ids only. The objects in a league link to each other
+    # too deeply to pickle, so this is what gets sent between processes
+    return ([[player.id for player in team.boards] for team in league['teams']],
+            [player.id for player in league['players']])
+
+
+def unpack_league(spec, packed):
+    team_ids, player_ids = packed
+    players, _, alternates, alts_split = build_players(spec)
+    teams = []
+    for ids in team_ids:
+        team = Team(spec.boards)
+        for board, i in enumerate(ids):
+            team.changeBoard(board, players[i])
+        teams.append(team)
+    updatePref(players, teams)
     for player in players:
-        filtered_players = [p for p in players if p.board != player.board]
-        player.friends = convert_name_list(player.friends, filtered_players)
-        player.avoid = convert_name_list(player.avoid, filtered_players)
+        player.setReqMet()
+    return {'teams': teams,
+            'players': [players[i] for i in player_ids],
+            'alternates': alternates,
+            'team_rating_bounds': spec.team_rating_bounds,
+            'alt_rating_bounds': spec.alt_rating_bounds,
+            'alts_split': alts_split}
+
+
+def make_league(spec, seed=None, anneal_steps=0, variance_weight=0.03):
+    rng = random.Random(seed)
+    boards, num_teams = spec.boards, spec.num_teams
+
+    players, players_split, alternates, alts_split = build_players(spec)
 
     # randomly shuffle players
     for board in players_split:
-        random.shuffle(board)
+        rng.shuffle(board)
 
     teams = []
     for n in range(num_teams):
@@ -252,22 +827,134 @@ def make_league(playerdata, boards, balance):
             teams[team].changeBoard(n, player)
 
     updatePref(players, teams)
+    if anneal_steps:
+        anneal(players, teams, rng, anneal_steps, variance_weight)
     updateSort(players, teams)
 
-    def swapPlayers(teama, playera, teamb, playerb, board):
-        #swap players between teams - ensure players are same board for input
-        teama.changeBoard(board,playerb)
-        teamb.changeBoard(board,playera)
-
-    def testSwap(teama, playera, teamb, playerb, board):
-        #try a swap and return the preference change if this swap was made
-        prior_pref = teama.team_pref_score + teamb.team_pref_score
-        swapPlayers(teama, playera, teamb, playerb, board) #swap players forwards
-        updatePref(players, teams)
-        post_pref = teama.team_pref_score + teamb.team_pref_score
-        swapPlayers(teama, playerb, teamb, playera, board) #swap players back
-        updatePref(players, teams)
-        return post_pref - prior_pref #more positive = better swap
+    hill_climb(players, teams)
+
+    for player in players:
+        player.setReqMet()
+
+    return {'teams': teams,
+            'players': players,
+            'alternates': alternates,
+            'team_rating_bounds': spec.team_rating_bounds,
+            'alt_rating_bounds': spec.alt_rating_bounds,
+            'alts_split': alts_split}
+
+
+def repair_league(spec, previous, seed=None):
+    # A league as close as possible to a previous one (see read_previous) after registrations
+    # changed. Players who are still playing keep their team, on whichever board they are on now.
+    # If two of a team's players now share a board, the one who was already on it stays. Everyone
+    # else fills the places left, in random order, and only they are swapped to make people happier
+    rng = random.Random(seed)
+    players, players_split, alternates, alts_split = build_players(spec)
+    teams = [Team(spec.boards) for _ in range(spec.num_teams)]
+
+    moved = []
+    for n, board in enumerate(players_split):
+        placed = [p for p in board if previous.get(p.name.lower(), (spec.num_teams,))[0] < spec.num_teams]
+        placed.sort(key=lambda p: previous[p.name.lower()][1] != n)
+        for player in placed:
+            team = teams[previous[player.name.lower()][0]]
+            if team.boards[n] is None:
+                team.changeBoard(n, player)
+        free = [p for p in board if p.team is None]
+        rng.shuffle(free)
+        for team, player in zip([team for team in teams if team.boards[n] is None], free):
+            team.changeBoard(n, player)
+        moved.extend(free)
+
+    updatePref(players, teams)
+    local_climb(moved) # teams stay in their old order, so keep their numbers
+    for player in players:
+        player.setReqMet()
+
+    return {'teams': teams,
+            'players': players,
+            'alternates': alternates,
+            'team_rating_bounds': spec.team_rating_bounds,
+            'alt_rating_bounds': spec.alt_rating_bounds,
+            'alts_split': alts_split,
+            'moved': moved}
+
+
+def local_climb(movable):
+    # hill climb that only swaps the movable players with each other, taking any swap on the same
+    # board that makes people happier until none does
+    by_board = {}
+    for player in movable:
+        by_board.setdefault(player.board, []).append(player)
+    improved = True
+    while improved:
+        improved = False
+        for board, group in by_board.items():
+            for playera, playerb in combinations(group, 2):
+                teama, teamb = playera.team, playerb.team
+                if testSwap(teama, playera, teamb, playerb, board) > 0:
+                    swapPlayers(teama, playera, teamb, playerb, board)
+                    updatePref(teama.boards + teamb.boards, (teama, teamb))
+                    improved = True
+
+
+def anneal(players, teams, rng, steps, variance_weight, start_temp=2.0, end_temp=0.05):
+    # simulated annealing over same-board swaps, maximising
+    #   total_happiness(teams) - variance_weight * team_rating_variance(teams)
+    # half the swaps tried bring a player together with a friend or away from an avoid, the rest
+    # are random. The teams are left as the best arrangement seen
+    n_boards = len(teams[0].boards)
+    league_mean = sum([team.getMean() for team in teams]) / len(teams)
+    variance_change = partial(rating_variance_improvement, league_mean, n_boards)
+    scale = 2 / len(teams) # a swap changes two of the team means
+    wanting = [player for player in players if player.friends or player.avoid]
+
+    def propose():
+        if wanting and rng.random() < 0.5:
+            player = rng.choice(wanting)
+            other = rng.choice(player.friends + player.avoid)
+            if other in player.friends:
+                if other.team is player.team:
+                    return None
+                if rng.random() < 0.5:
+                    player, other = other, player
+                return (player.team, player, other.team, other.team.getPlayer(player.board), player.board)
+            if other.team is not player.team:
+                return None
+            team = rng.choice(teams)
+        else:
+            other = rng.choice(players)
+            team = rng.choice(teams)
+        if team is other.team:
+            return None
+        return (other.team, other, team, team.getPlayer(other.board), other.board)
+
+    objective = best = total_happiness(teams) - variance_weight * team_rating_variance(teams, league_mean)
+    best_boards = [list(team.boards) for team in teams]
+    for step in range(steps):
+        temp = start_temp * (end_temp / start_temp) ** (step / steps)
+        swap = propose()
+        if swap is None:
+            continue
+        teama, playera, teamb, playerb, board = swap
+        change = testSwap(*swap) - variance_weight * scale * variance_change((playera, playerb))
+        if change >= 0 or rng.random() < math.exp(change / temp):
+            swapPlayers(*swap)
+            updatePref(teama.boards + teamb.boards, (teama, teamb))
+            objective += change
+            if objective > best + 0.0000001:
+                best = objective
+                best_boards = [list(team.boards) for team in teams]
+
+    for team, boards in zip(teams, best_boards):
+        for board, player in enumerate(boards):
+            team.changeBoard(board, player)
+    updatePref(players, teams)
+
+
+def hill_climb(players, teams):
+    # players and teams are sorted as updateSort leaves them, and are left sorted the same way
 
     # take player from least happy team
     # calculate the overall preference score if player were to swap to each of the preferences' teams or preference swaps into their team.
@@ -277,9 +964,10 @@ def make_league(playerdata, boards, balance):
     # if no improving swaps are available, go to the next player
     # if end of the list reached with no swaps made: stop
 
-    p = 0
-    while p < len(players):
-        player = players[p] #least happy player
+    def has_conflict(player):
+        return any(avoid.team is player.team for avoid in player.avoid)
+
+    def candidate_swaps(player):
         swaps = []
         for friend in player.friends:
             # test both direction swaps for each friend and whichever is better, add the swap ID and score to temp
@@ -296,29 +984,57 @@ def make_league(playerdata, boards, balance):
         for avoid in player.avoid:
             #test moving player to be avoided to the best preferred team
             if player.team == avoid.team: #otherwise irrelevant
-                for swap_team in teams:
+                for swap_team, swap_score in zip(teams, moveScores(avoid, teams)):
                     swap_ID = (avoid.team, avoid, swap_team, swap_team.getPlayer(avoid.board), avoid.board)
-                    swap_score = testSwap(*swap_ID)
                     swaps.append((swap_score,swap_ID))
+        if not any(swap_score > 0 for swap_score, _ in swaps):
+            return [] # nothing to sort, no swap will be made
         swaps.sort()
+        return swaps
+
+    # players are taken least happy first from a heap ranked like updateSort would order them.
+    # A player with no improving swap is exhausted until a swap changes one of the teams its
+    # candidate swaps look at: its own, its friends', or every team if it shares a team with an avoid.
+    order = StableOrder(players, playerSortKey)
+    team_order = StableOrder(teams, teamSortKey)
+    conflicted = {player for player in players if has_conflict(player)}
+    queued = {player: order.rank[player] for player in players}
+    heap = [(rank, player) for player, rank in queued.items()]
+    heapq.heapify(heap)
+
+    def wake(player):
+        rank = order.rank[player]
+        if queued.get(player) != rank:
+            queued[player] = rank
+            heapq.heappush(heap, (rank, player))
+
+    while heap:
+        rank, player = heapq.heappop(heap)
+        if queued.get(player) != rank: # stale entry
+            continue
+        del queued[player]
+        swaps = candidate_swaps(player)
         if swaps and swaps[-1][0] > 0: # there is a swap to make and it improves the preference score
+            teama, _, teamb, _, _ = swaps[-1][1]
             swapPlayers(*(swaps[-1][1]))
             # print(swaps[-1])
-            updatePref(players, teams)
-            updateSort(players, teams)
-            p = 0
-        else: # go to the next player in the list
-            p += 1
-
-    for player in players:
-        player.setReqMet()
-
-    return {'teams': teams,
-            'players': players,
-            'alternates': alternates,
-            'team_rating_bounds': team_rating_bounds,
-            'alt_rating_bounds': alt_rating_bounds,
-            'alts_split': alts_split}
+            changed = teama.boards + teamb.boards
+            updatePref(changed, (teama, teamb)) #only the swapped teams change
+            order.update(changed)
+            team_order.update((teama, teamb))
+            teams.sort(key=team_order.rank.__getitem__)
+            for member in changed:
+                if has_conflict(member):
+                    conflicted.add(member)
+                else:
+                    conflicted.discard(member)
+            for member in changed:
+                wake(member)
+                for other in member.linked:
+                    wake(other)
+            for other in conflicted:
+                wake(other)
+    players.sort(key=order.rank.__getitem__)
 
 
 # Reduce variance functions
@@ -330,8 +1046,9 @@ def intersection(lst1, lst2):
 # Does this swap have a neutral effect on happiness
 def is_neutral_swap(swap):
     def count_on_team(attr, player, team):
-        n = len(intersection(getattr(player, attr), team.boards))
-        n += len([p for p in team.boards if player in getattr(p, attr)])
+        # only the player's own friends/avoids and the players listing it can count
+        n = len([p for p in getattr(player, attr) if p.team is team])
+        n += len([p for p in player.linked if p.team is team and player in getattr(p, attr)])
         return n
 
     count_friends_on_team = partial(count_on_team, 'friends')
@@ -379,9 +1096,37 @@ def rating_variance_improvement(league_mean, n_boards, swap):
     return new_score - initial_score
 
 
-def get_best_swap(swaps, fun):
-    best_swap = min(swaps, key=fun)
-    return best_swap, fun(best_swap)
+class SwapIndex:
+    # Neutral swaps in a heap ordered by variance improvement, then by when they were found (which
+    # is the order the swap list used to be in). A swap's value only depends on its two teams, and
+    # every swap involving a changed team is removed, so each swap is only ever scored once.
+    def __init__(self, fun, swaps):
+        self.fun = fun
+        self.heap = []
+        self.live = set()
+        self.by_player = {}
+        self.count = 0
+        self.add(swaps)
+
+    def add(self, swaps):
+        for swap in swaps:
+            heapq.heappush(self.heap, (self.fun(swap), self.count, swap))
+            self.live.add(self.count)
+            for player in swap:
+                self.by_player.setdefault(player, set()).add(self.count)
+            self.count += 1
+
+    def remove_players(self, players):
+        for player in players:
+            self.live.difference_update(self.by_player.pop(player, ()))
+
+    def best(self):
+        while self.heap and self.heap[0][1] not in self.live:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None, 0
+        value, _, swap = self.heap[0]
+        return swap, value
 
 
 def perform_swap(swap):
@@ -396,40 +1141,42 @@ def perform_swap(swap):
 def update_swaps(swaps, swap_performed, teams):
     pa, pb = swap_performed
     affected_players = pa.team.boards + pb.team.boards
+    affected_teams = (pa.team, pb.team)
     # remove all swaps involving players affected by the swap.
-    swaps = [swap for swap in swaps
-             if not intersection(swap, affected_players)]
+    swaps.remove_players(affected_players)
 
     # find new neutral swaps involving the players affected by swap.
     for player in affected_players:
         board = player.board
         players_on_board = [team.boards[board] for team in teams
-                            if not team.boards[board] in affected_players]
-        swaps.extend([(player, p) for p in players_on_board
-                      if is_neutral_swap((player, p))])
+                            if team not in affected_teams]
+        swaps.add([(player, p) for p in players_on_board
+                   if is_neutral_swap((player, p))])
 
-    swaps.extend([swap for swap in zip(pa.team.boards, pb.team.boards)
-                  if is_neutral_swap(swap)])
+    swaps.add([swap for swap in zip(pa.team.boards, pb.team.boards)
+               if is_neutral_swap(swap)])
 
     return swaps
 
 
-def reduce_variance(teams):
+def reduce_variance(teams, max_iterations=200, engine='python'):
+    if engine == 'numpy':
+        import numpy_engine
+        return numpy_engine.reduce_variance(teams, max_iterations)
+
     # players = flatten([team.boards for team in teams])
 
     league_mean = sum([team.getMean() for team in teams]) / len(teams)
     n_boards = len(teams[0].boards)
 
-    swaps = get_swaps(teams)
-
     eval_fun = partial(rating_variance_improvement, league_mean, n_boards)
-    best_swap, swap_value = get_best_swap(swaps, eval_fun)
+    swaps = SwapIndex(eval_fun, get_swaps(teams))
+    best_swap, swap_value = swaps.best()
 
-    # infinite loop possibility here?
+    # every swap made lowers the variance, so this stops even without max_iterations (None or 0)
     i = 0
-    max_iterations = 200
     epsilon = 0.0000001
-    while swap_value <= -epsilon and i < max_iterations:
+    while swap_value <= -epsilon and (not max_iterations or i < max_iterations):
         # variance = team_rating_variance(teams, league_mean)
         # updatePref(players, teams)
         # score = total_happiness(teams)
@@ -442,55 +1189,117 @@ def reduce_variance(teams):
         i += 1
         perform_swap(best_swap)
         swaps = update_swaps(swaps, best_swap, teams)
-        best_swap, swap_value = get_best_swap(swaps, eval_fun)
+        best_swap, swap_value = swaps.best()
 
     # means = [team.getMean() for team in teams]
     # print("means: ", sorted(means))
     return teams
 
 
+def happiness_contribution(player, team_index):
+    # what the player adds to the preference score of a team it is put on, beyond what it adds to
+    # any team, by index of the teams holding players it lists or that list it
+    extra = Counter()
+    for friend in player.friends:
+        extra[team_index[id(friend.team)]] += 2
+    for avoid in player.avoid:
+        extra[team_index[id(avoid.team)]] -= 1
+    for other in player.linked:
+        if player in other.friends:
+            extra[team_index[id(other.team)]] += 2
+        if player in other.avoid:
+            extra[team_index[id(other.team)]] -= 1
+    return extra
+
+
+def balance_teams(teams, max_passes=10):
+    # Rebalances team means a board at a time: the board's players are reassigned to teams by a
+    # min cost assignment on (team rating sum - average team rating sum)**4, which weighs the teams
+    # furthest from the average most and so goes for the rating range. Players on a board
+    # don't list each other, so the league's happiness is a sum of what each of them adds to the
+    # team it is on, and a player may only go to teams it adds exactly as much to as its own, so
+    # happiness stays as it was. Players that can't go anywhere else are left out of the
+    # assignment. No pass can make the total cost worse, and passes stop once one doesn't improve
+    # it. This takes the big steps the variance swaps would need many iterations for, and they
+    # finish off what's left
+    n_teams = len(teams)
+    n_boards = len(teams[0].boards)
+    target = sum([team.rating_sum for team in teams]) / n_teams
+
+    def deviation(rating_sum):
+        return squared_diff(rating_sum, target) ** 2
+
+    def spread():
+        return sum([deviation(team.rating_sum) for team in teams])
+
+    for _ in range(max_passes):
+        before = spread()
+        for board in range(n_boards):
+            team_index = {id(team): t for t, team in enumerate(teams)}
+            on_board = [team.boards[board] for team in teams]
+            extras = [happiness_contribution(player, team_index) for player in on_board]
+            movable = [i for i, extra in enumerate(extras)
+                       if any(extra[t] == extra[i] for t in range(n_teams) if t != i)]
+            if len(movable) < 2:
+                continue
+            others = [teams[t].rating_sum - on_board[t].rating for t in movable]
+            costs = [[deviation(other + on_board[i].rating) for other in others] for i in movable]
+            weight = 1 + sum([max(row) for row in costs]) # more than any allowed assignment costs
+            cost = [[x if extras[i][t] == extras[i][i] else x + weight for t, x in zip(movable, row)]
+                    for i, row in zip(movable, costs)]
+            for i, column in zip(movable, min_cost_assignment(cost)):
+                teams[movable[column]].changeBoard(board, on_board[i])
+        if spread() >= before - 0.0000001:
+            break
+
+    players = [player for team in teams for player in team.boards]
+    updatePref(players, teams)
+    return teams
+
+
 # Output stuff
 
-def generate_print_output(league):
+def render_league(league):
+    # the readable tables for a league as one string
     players, alternates, teams, team_rating_bounds, alt_rating_bounds, alts_split =\
         league['players'], league['alternates'], league['teams'], \
         league['team_rating_bounds'], league['alt_rating_bounds'], league['alts_split']
     boards = len(teams[0].boards)
     num_teams = len(teams)
-    terminal.separator()
-
-    print("Team rating range: ", team_rating_range(teams))
-    print("Team rating variance: ", team_rating_variance(teams))
-    print("Total happiness: ", total_happiness(teams))
-    print(f"Using: {len(players)} players and {len(alternates)} alternates")
-    print(terminal.green(f"Previous Season Alternates"))
-    print(terminal.blue(f"Requested Alternate"))
-    print("TEAMS")
-    terminal.smallheader("Team #")
+    out = [terminal.separator_line()]
+
+    out.append(f"Team rating range:  {team_rating_range(teams)}\n")
+    out.append(f"Team rating variance:  {team_rating_variance(teams)}\n")
+    out.append(f"Total happiness:  {total_happiness(teams)}\n")
+    out.append(f"Using: {len(players)} players and {len(alternates)} alternates\n")
+    out.append(terminal.green(f"Previous Season Alternates") + "\n")
+    out.append(terminal.blue(f"Requested Alternate") + "\n")
+    out.append("TEAMS\n")
+    out.append(terminal.smallcell("Team #", terminal.underline))
     for i in range(boards):
         n,x = team_rating_bounds[i]
-        terminal.largeheader(f"Board #{i+1} [{n},{x})")
-    terminal.largeheader("Mean rating")
-    print()
+        out.append(terminal.largecell(f"Board #{i+1} [{n},{x})", terminal.underline))
+    out.append(terminal.largecell("Mean rating", terminal.underline))
+    out.append("\n")
     for team_i in range(num_teams):
-        terminal.smallcol(f"#{team_i+1}")
+        out.append(terminal.smallcell(f"#{team_i+1}"))
         for board_i in range(boards):
             team = teams[team_i]
             player = team.boards[board_i]
             short_name = player.name[:20]
             player_name = f"{short_name} ({player.rating})"
-            terminal.largecol(player_name, terminal.green if player.previous_season_alt else None)
-        terminal.largecol("{0:.2f}".format(team.getMean()))
-        print()
-    print()
-    print("ALTERNATES")
-    terminal.smallheader(" ")
+            out.append(terminal.largecell(player_name, terminal.green if player.previous_season_alt else None))
+        out.append(terminal.largecell("{0:.2f}".format(team.getMean())))
+        out.append("\n")
+    out.append("\n")
+    out.append("ALTERNATES\n")
+    out.append(terminal.smallcell(" ", terminal.underline))
     for i in range(boards):
         n,x = alt_rating_bounds[i]
-        terminal.largeheader(f"Board #{i+1} [{n},{x})")
-    print()
+        out.append(terminal.largecell(f"Board #{i+1} [{n},{x})", terminal.underline))
+    out.append("\n")
     for player_i in range(max([len(a) for a in alts_split])):
-        terminal.smallcol(" ")
+        out.append(terminal.smallcell(" "))
         for board_i in range(boards):
             board = alts_split[board_i]
             player_name = ""
@@ -499,11 +1308,16 @@ def generate_print_output(league):
                 short_name = player.name
                 short_name = player.name[:20]
                 player_name = f"{short_name} ({player.rating})"
-            terminal.largecol(player_name, terminal.blue if player.alt else None)
-        print()
+            out.append(terminal.largecell(player_name, terminal.blue if player.alt else None))
+        out.append("\n")
+    return "".join(out)
+
+
+def generate_print_output(league, outfile=None):
+    (outfile or sys.stdout).write(render_league(league))
 
 
-# WIP for upload format for heltour
+# upload format for heltour
 def generate_json_output_object(teams, alts_split):
     jsonoutput = []
     # [{"action":"change-member",
@@ -524,7 +1338,6 @@ def generate_json_output_object(teams, alts_split):
             jsonoutput.append(pp)
 
     for b, board in enumerate(alts_split):
-        print(board)
         for _, pp in enumerate(board):
             pp = {"action": "create-alternate",
                   "board_number": b+1,
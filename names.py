@@ -0,0 +1,47 @@
+"""Resolving free-text friends/avoid lists to player names
+"""
+import re
+
+BOUNDARY = r"[^-_a-zA-Z0-9]"
+SPLIT = re.compile(BOUNDARY + "+", flags=re.I)
+SIMPLE_NAME = re.compile(r"[-_a-zA-Z0-9]+")
+
+
+class NameIndex:
+    # Finds which names appear in a string the same way as searching for each one with
+    # ({boundary}|^){name}({boundary}|$), ignoring case, but each string is split into tokens
+    # once and looked up in a dict. Results are cached, so build one index per run.
+    def __init__(self, names):
+        self.names = list(names)
+        self.by_key = {}
+        self.other = [] # names that aren't a single token have to be searched for
+        for i, name in enumerate(self.names):
+            if SIMPLE_NAME.fullmatch(name):
+                self.by_key.setdefault(name.lower(), []).append(i)
+            else:
+                self.other.append(i)
+        self.cache = {}
+
+    def positions(self, string_of_names):
+        # sorted positions in names of every name found in string_of_names
+        if string_of_names in self.cache:
+            return self.cache[string_of_names]
+        found = set()
+        for token in SPLIT.split(string_of_names):
+            if token.isascii():
+                found.update(self.by_key.get(token.lower(), ()))
+            else:
+                # re.I matches a few non-ascii letters against a-z, so compare those the slow way
+                for key, positions in self.by_key.items():
+                    if re.fullmatch(key, token, flags=re.I):
+                        found.update(positions)
+        pattern = r"({1}|^){0}({1}|$)"
+        for i in self.other:
+            if re.search(pattern.format(self.names[i], BOUNDARY), string_of_names, flags=re.I):
+                found.add(i)
+        result = self.cache[string_of_names] = sorted(found)
+        return result
+
+    def resolve(self, string_of_names):
+        # set of names found in string_of_names
+        return {self.names[i] for i in self.positions(string_of_names)}
@@ -0,0 +1,167 @@
+"""Array backed version of reduce_variance
+
+The league is held as a teams x boards matrix of player indexes, a rating vector and
+friends/avoid adjacency lists, and the neutral swaps of a whole board are found and scored in one
+vectorized pass. It takes and returns the same objects as the pure python version and makes
+exactly the same swaps, so it gives the same teams. The hill-climb stays in python, where a swap
+only rescores the players it touches and is quicker than any vectorized version of it.
+"""
+import numpy as np
+
+
+def _adjacency(lists, n):
+    # forward and reverse adjacency as lists of index arrays
+    forward = [np.array(l, dtype=np.int64) for l in lists]
+    reverse = [[] for _ in range(n)]
+    for i, l in enumerate(lists):
+        for j in l:
+            reverse[j].append(i)
+    return forward, [np.array(l, dtype=np.int64) for l in reverse]
+
+
+def _gather(lists, members):
+    return np.concatenate([lists[i] for i in members])
+
+
+class _League:
+    def __init__(self, players, teams):
+        self.players = players
+        self.teams = teams
+        self.n = len(players)
+        self.num_teams = len(teams)
+        self.boards = len(teams[0].boards)
+        index = {id(player): i for i, player in enumerate(players)}
+        team_index = {id(team): t for t, team in enumerate(teams)}
+        self.friend_lists = [[index[id(f)] for f in p.friends] for p in players]
+        self.avoid_lists = [[index[id(a)] for a in p.avoid] for p in players]
+        self.friends, self.friended_by = _adjacency(self.friend_lists, self.n)
+        self.avoid, self.avoided_by = _adjacency(self.avoid_lists, self.n)
+        self.rating = np.array([p.rating for p in players])
+        self.board_of = np.array([p.board for p in players], dtype=np.int64)
+        self.team_of = np.array([team_index[id(p.team)] for p in players], dtype=np.int64)
+        self.assign = np.array([[index[id(p)] for p in team.boards] for team in teams], dtype=np.int64)
+
+    def per_player(self, lists, members):
+        return np.bincount(_gather(lists, members), minlength=self.n)
+
+    def swap(self, a, b, board):
+        pa, pb = self.assign[a, board], self.assign[b, board]
+        self.assign[a, board], self.assign[b, board] = pb, pa
+        self.team_of[pa], self.team_of[pb] = b, a
+
+    def write_back(self):
+        for team in self.teams:
+            for player in team.boards:
+                player.team = None
+            team.boards = [None] * self.boards
+            team.rating_sum = 0
+        for t, team in enumerate(self.teams):
+            for board, i in enumerate(self.assign[t]):
+                team.changeBoard(board, self.players[i])
+
+
+def _variance_improvement(league_mean, n_boards, team_sum, team_of, rating, pa, pb):
+    # vectorized rating_variance_improvement. float_power matches python's ** exactly, so equal
+    # swaps tie the same way as in the python engine
+    def score(a, b):
+        return (np.float_power(league_mean - a, 2) + np.float_power(league_mean - b, 2)) / 2
+
+    a_mean = team_sum[team_of[pa]] / n_boards
+    b_mean = team_sum[team_of[pb]] / n_boards
+    initial_score = score(a_mean, b_mean)
+    rating_diff = rating[pb] - rating[pa]
+    new_score = score(a_mean + rating_diff / n_boards, b_mean - rating_diff / n_boards)
+    return new_score - initial_score
+
+
+def reduce_variance(teams, max_iterations=200):
+    # see maketeams3.reduce_variance: neutral swaps are found a board (or a player) at a time and
+    # the best one is an argmin over every live swap, in the order the python engine finds them
+    players = [player for team in teams for player in team.boards]
+    league = _League(players, teams)
+    team_of, assign, n_boards = league.team_of, league.assign, league.boards
+    neighbours = [np.concatenate((f, r)) for f, r in zip(league.friends, league.friended_by)]
+    enemies = [np.concatenate((a, r)) for a, r in zip(league.avoid, league.avoided_by)]
+
+    league_mean = sum([team.getMean() for team in teams]) / len(teams)
+    team_sum = np.array([sum(p.rating for p in team.boards) for team in teams], dtype=np.int64)
+
+    def own(lists):
+        return np.array([np.count_nonzero(team_of[lists[i]] == team_of[i]) for i in range(league.n)],
+                        dtype=np.int64)
+
+    own_friends, own_avoids = own(neighbours), own(enemies)
+
+    def on_teams(lists, members):
+        # rows: members, columns: how many of their friends/avoids (either way) are on each team
+        counts = np.zeros((len(members), league.num_teams), dtype=np.int64)
+        for row, i in enumerate(members):
+            np.add.at(counts[row], team_of[lists[i]], 1)
+        return counts
+
+    def neutral(i, others):
+        # is swapping player i with each of others happiness neutral (see is_neutral_swap)
+        t, others_t = team_of[i], team_of[others]
+        pre = own_friends[i] + own_friends[others] - own_avoids[i] - own_avoids[others]
+        members = assign[t]
+        post = np.bincount(team_of[neighbours[i]], minlength=league.num_teams)[others_t] \
+            + league.per_player(neighbours, members)[others] \
+            - np.bincount(team_of[enemies[i]], minlength=league.num_teams)[others_t] \
+            - league.per_player(enemies, members)[others]
+        return pre == post
+
+    swaps_a, swaps_b = [], []
+    for board in range(n_boards):
+        on_board = assign[:, board]
+        friends, avoids = on_teams(neighbours, on_board), on_teams(enemies, on_board)
+        score = own_friends[on_board] - own_avoids[on_board]
+        pre = score[:, None] + score[None, :]
+        post = friends + friends.T - avoids - avoids.T
+        rows, cols = np.triu_indices(league.num_teams, 1)
+        keep = (pre == post)[rows, cols]
+        swaps_a.append(on_board[rows[keep]])
+        swaps_b.append(on_board[cols[keep]])
+    swaps_a, swaps_b = np.concatenate(swaps_a), np.concatenate(swaps_b)
+
+    def values(pa, pb):
+        return _variance_improvement(league_mean, n_boards, team_sum, team_of, league.rating, pa, pb)
+
+    swap_values = values(swaps_a, swaps_b)
+
+    i = 0
+    epsilon = 0.0000001
+    while len(swap_values) and (not max_iterations or i < max_iterations):
+        best = int(np.argmin(swap_values))
+        if not swap_values[best] <= -epsilon:
+            break
+        i += 1
+        pa, pb = swaps_a[best], swaps_b[best]
+        league.swap(team_of[pa], team_of[pb], league.board_of[pa])
+        a, b = team_of[pa], team_of[pb] # after the swap, like update_swaps
+        team_sum[a] += league.rating[pa] - league.rating[pb]
+        team_sum[b] += league.rating[pb] - league.rating[pa]
+        affected = np.concatenate((assign[a], assign[b]))
+        for j in affected:
+            own_friends[j] = np.count_nonzero(team_of[neighbours[j]] == team_of[j])
+            own_avoids[j] = np.count_nonzero(team_of[enemies[j]] == team_of[j])
+
+        # swaps involving players on the two teams are dead, new ones are added at the end
+        dead = np.isin(swaps_a, affected) | np.isin(swaps_b, affected)
+        swap_values[dead] = np.inf
+        new_a, new_b = [], []
+        other_teams = np.array([t for t in range(league.num_teams) if t != a and t != b], dtype=np.int64)
+        for j in affected:
+            others = assign[other_teams, league.board_of[j]]
+            keep = neutral(j, others)
+            new_a.append(np.full(np.count_nonzero(keep), j, dtype=np.int64))
+            new_b.append(others[keep])
+        keep = np.array([neutral(x, np.array([y]))[0] for x, y in zip(assign[a], assign[b])], dtype=bool)
+        new_a.append(assign[a][keep])
+        new_b.append(assign[b][keep])
+        new_a, new_b = np.concatenate(new_a), np.concatenate(new_b)
+        swaps_a = np.concatenate((swaps_a, new_a))
+        swaps_b = np.concatenate((swaps_b, new_b))
+        swap_values = np.concatenate((swap_values, values(new_a, new_b)))
+
+    league.write_back()
+    return teams
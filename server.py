@@ -0,0 +1,121 @@
+import click
+import random
+import json
+import sys
+import signal
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import maketeams3
+
+# query parameters of GET /teams, with their types and defaults as in maketeams3
+PARAMS = {'boards': (int, 6), 'balance': (float, 0.8), 'count': (int, 100), 'seed': (int, None),
+          'keep': (int, 100), 'variance_iterations': (int, 200), 'engine': (str, 'python')}
+
+
+_registrations = None
+
+def _start_worker(path):
+    # each worker loads the file once, when the server starts
+    global _registrations
+    _registrations = maketeams3.Registrations(path)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _make_leagues(boards, balance, seeds):
+    spec = _registrations.spec(boards, balance)
+    return [maketeams3.pack_league(maketeams3.make_league(spec, seed)) for seed in seeds]
+
+def _reduce_league(boards, balance, packed, variance_iterations, engine):
+    spec = _registrations.spec(boards, balance)
+    league = maketeams3.reduce_league(maketeams3.unpack_league(spec, packed), variance_iterations, engine=engine)
+    return maketeams3.pack_league(league)
+
+
+def make_teams(registrations, pool, jobs, boards, balance, count, seed, keep, variance_iterations, engine):
+    # the league a maketeams3 run with these options would choose, and how it was found
+    spec = registrations.spec(boards, balance)
+    if any(len(board) < spec.num_teams for board in spec.players_split):
+        raise ValueError(f"not enough players to fill every board of {spec.num_teams} teams")
+    seeds = maketeams3.restart_seeds(seed, count)
+    chunksize = min(max(1, count // (jobs * 4)), 4) # as in maketeams3.run
+    futures = [(chunk, pool.submit(_make_leagues, boards, balance, chunk))
+               for chunk in (seeds[c:c + chunksize] for c in range(0, count, chunksize))]
+    best = maketeams3.BestLeagues(keep)
+    for chunk, future in futures:
+        for league_seed, packed in zip(chunk, future.result()):
+            best.add(league_seed, maketeams3.unpack_league(spec, packed))
+    if best.happiness is None:
+        raise ValueError("no leagues were made, count must be at least 1")
+    futures = [pool.submit(_reduce_league, boards, balance, maketeams3.pack_league(league), variance_iterations, engine)
+               for league in best.leagues]
+    reduced = [maketeams3.unpack_league(spec, future.result()) for future in futures]
+    league = min(reduced, key=lambda l: maketeams3.team_rating_range(l['teams']))
+    return league, best
+
+
+class Handler(BaseHTTPRequestHandler):
+    # GET /teams?boards=6&balance=0.8&... returns the heltour upload for those options. The seed,
+    # happiness and rating range go in X- headers
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/teams':
+            return self.reply(404, {'error': 'only /teams is served'})
+        query = parse_qs(url.query)
+        try:
+            options = {name: kind(query[name][-1]) if name in query else default
+                       for name, (kind, default) in PARAMS.items()}
+            if options['engine'] not in ('python', 'numpy'):
+                raise ValueError("engine must be python or numpy")
+            if options['boards'] < 1:
+                raise ValueError("boards must be at least 1")
+            if options['balance'] <= 0:
+                raise ValueError("balance must be more than 0")
+            if options['seed'] is None:
+                options['seed'] = random.randrange(2**32)
+            league, best = make_teams(self.server.registrations, self.server.pool, self.server.jobs, **options)
+        except ValueError as error:
+            return self.reply(400, {'error': str(error)})
+        except Exception as error: # still answer the client, the traceback goes to the log
+            traceback.print_exc()
+            return self.reply(500, {'error': f"{type(error).__name__}: {error}"})
+        self.reply(200, maketeams3.generate_json_output_object(league['teams'], league['alts_split']),
+                   {'X-Seed': options['seed'],
+                    'X-Happiness': best.happiness,
+                    'X-Rating-Range': maketeams3.team_rating_range(league['teams'])})
+
+    def reply(self, status, body, headers={}):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@click.command()
+@click.option('--players', help='the json file containing the players.', required=True)
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8045)
+@click.option('--jobs', default=1, type=click.IntRange(min=1), help='number of worker processes shared by all requests')
+def run(players, host, port, jobs):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.registrations = maketeams3.Registrations(players)
+    server.pool = ProcessPoolExecutor(max_workers=jobs, initializer=_start_worker, initargs=(players,))
+    server.jobs = jobs
+    print(f"Serving teams for {players} on http://{host}:{server.server_port}/teams", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        maketeams3._stop_workers(server.pool) # not waiting for requests still being worked on
+
+
+if __name__ == "__main__":
+    run()
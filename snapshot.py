@@ -0,0 +1,123 @@
+"""Compiled binary snapshots of registration files, see maketeams3.read_players
+"""
+import click
+import json
+import mmap
+import os
+import struct
+
+from names import NameIndex
+
+# header: magic, format version, size and mtime of the json it was compiled from, number of players
+# and of edges
+HEADER = struct.Struct('<8sIqqII')
+MAGIC = b'MT4545SN'
+VERSION = 1
+# one fixed width record per player: rating, flags, then (offset, length) of six strings in the
+# string table (counted in characters, it is decoded in one go) and (offset, count) of the resolved
+# friends and avoid in the edge array
+RECORD = struct.Struct('<iBxxx16I')
+STRINGS = ['name', 'date_created', 'friends', 'avoid', 'account_status', 'previous_season_alternate']
+FLAGS = ['in_slack', 'has_20_games', 'prefers_alt']
+HAS_PREVIOUS = 8 # previous_season_alternate is in the record (flags after FLAGS)
+
+
+def snapshot_path(players):
+    return players + '.snapshot'
+
+
+def source_stamp(players):
+    stat = os.stat(players)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_snapshot(players, player_data, names):
+    # names is a NameIndex of player_data, its positions are the resolved friends and avoid
+    strings = []
+    length = 0
+    edges = []
+    records = []
+
+    def add_string(text):
+        nonlocal length
+        strings.append(text)
+        length += len(text)
+        return length - len(text), len(text)
+
+    def add_edges(positions):
+        edges.extend(positions)
+        return len(edges) - len(positions), len(positions)
+
+    for player in player_data:
+        flags = sum(1 << i for i, flag in enumerate(FLAGS) if player[flag])
+        if 'previous_season_alternate' in player:
+            flags |= HAS_PREVIOUS
+        fields = [n for key in STRINGS for n in add_string(player.get(key) or '')]
+        fields += add_edges(names.positions(player['friends'])) + add_edges(names.positions(player['avoid']))
+        records.append(RECORD.pack(player['rating'], flags, *fields))
+
+    size, mtime = source_stamp(players)
+    path = snapshot_path(players)
+    temp = path + f'.{os.getpid()}.tmp' # processes refreshing the same snapshot don't share one
+    with open(temp, 'wb') as outfile:
+        outfile.write(HEADER.pack(MAGIC, VERSION, size, mtime, len(player_data), len(edges)))
+        outfile.write(b''.join(records))
+        outfile.write(struct.pack(f'<{len(edges)}i', *edges))
+        outfile.write(''.join(strings).encode())
+    os.replace(temp, path)
+
+
+def load_snapshot(players):
+    # (player_data, names) from the snapshot of players, or None if there is none or it was
+    # compiled from a different version of the file
+    try:
+        with open(snapshot_path(players), 'rb') as infile, \
+                mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, size, mtime, n, n_edges = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION or (size, mtime) != source_stamp(players):
+                return None
+            start = HEADER.size
+            records = list(RECORD.iter_unpack(data[start:start + n * RECORD.size]))
+            start += n * RECORD.size
+            edges = struct.unpack_from(f'<{n_edges}i', data, start)
+            text = data[start + 4 * n_edges:].decode()
+    except (OSError, ValueError, struct.error): # missing, empty or cut short
+        return None
+
+    player_data = []
+    friends = {}
+    avoid = {}
+    for rating, flags, n, nl, d, dl, f, fl, a, al, s, sl, p, pl, fe, fn, ae, an in records:
+        player = {'name': text[n:n + nl],
+                  'rating': rating,
+                  'in_slack': bool(flags & 1),
+                  'has_20_games': bool(flags & 2),
+                  'prefers_alt': bool(flags & 4),
+                  'date_created': text[d:d + dl],
+                  'friends': text[f:f + fl],
+                  'avoid': text[a:a + al],
+                  'account_status': text[s:s + sl]}
+        if flags & HAS_PREVIOUS:
+            player['previous_season_alternate'] = text[p:p + pl]
+        friends[player['friends']] = list(edges[fe:fe + fn])
+        avoid[player['avoid']] = list(edges[ae:ae + an])
+        player_data.append(player)
+
+    names = NameIndex(p['name'] for p in player_data)
+    names.cache.update(friends)
+    names.cache.update(avoid)
+    return player_data, names
+
+
+@click.command()
+@click.argument('players')
+def run(players):
+    # compile PLAYERS to PLAYERS.snapshot, which maketeams3 then loads instead while the json is unchanged
+    with open(players) as infile:
+        player_data = json.load(infile)
+    write_snapshot(players, player_data, NameIndex(p['name'] for p in player_data))
+    print(f"Wrote {snapshot_path(players)}")
+
+
+if __name__ == "__main__":
+    run()
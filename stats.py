@@ -0,0 +1,56 @@
+"""Timers and counters for a run, see maketeams3 --stats
+"""
+import json
+import time
+
+from collections import Counter
+
+
+class Stats:
+    # Functions are timed and counted by replacing them with wrappers (see wrap), so nothing is
+    # added to the code being measured and there is no cost at all when stats aren't collected.
+    def __init__(self):
+        self.seconds = Counter()
+        self.counts = Counter()
+        self.start = time.perf_counter()
+
+    def wrap(self, owner, attr, timer=None, counter=None, amount=None):
+        # replace owner.attr with a version that adds its run time to seconds[timer] and one (or
+        # amount(*args)) to counts[counter] per call
+        original = getattr(owner, attr)
+        seconds, counts = self.seconds, self.counts
+
+        def counted(*args, **kwargs):
+            counts[counter] += amount(*args, **kwargs) if amount else 1
+            return original(*args, **kwargs)
+
+        def timed(*args, **kwargs):
+            if counter:
+                counts[counter] += amount(*args, **kwargs) if amount else 1
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                seconds[timer] += time.perf_counter() - start
+
+        setattr(owner, attr, timed if timer else counted)
+
+    def take(self):
+        # counts and timings so far, and start again from zero
+        taken = {'seconds': dict(self.seconds), 'counts': dict(self.counts)}
+        self.seconds.clear()
+        self.counts.clear()
+        return taken
+
+    def merge(self, taken):
+        self.seconds.update(taken['seconds'])
+        self.counts.update(taken['counts'])
+
+    def report(self):
+        return {'wall_seconds': time.perf_counter() - self.start,
+                'seconds': dict(self.seconds),
+                'counts': dict(self.counts)}
+
+    def write(self, path):
+        with open(path, 'w') as outfile:
+            json.dump(self.report(), outfile, indent=4)
@@ -0,0 +1,105 @@
+import click
+import random
+import json
+import sys
+import signal
+
+from concurrent.futures import ProcessPoolExecutor
+
+import maketeams3
+
+_registrations = None
+
+def _load_registrations(path):
+    global _registrations
+    _registrations = maketeams3.Registrations(path)
+
+def _start_worker(path):
+    # interrupts are left to the main process
+    _load_registrations(path)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def sweep_point(boards, balance, count, seed, keep, variance_iterations, engine):
+    # the league a maketeams3 run would choose for one grid point, summed up
+    spec = _registrations.spec(boards, balance)
+    point = {'boards': boards,
+             'balance': balance,
+             'teams': spec.num_teams,
+             'players': len(spec.players),
+             'alternates': len(spec.alternates)}
+    if any(len(board) < spec.num_teams for board in spec.players_split):
+        return dict(point, happiness=None) # some board can't be filled, so no league can be made
+    best = maketeams3.BestLeagues(keep)
+    for league_seed, league in maketeams3.make_leagues(spec, maketeams3.restart_seeds(seed, count)):
+        best.add(league_seed, league)
+    reduced = maketeams3.reduce_leagues(spec, best.leagues, variance_iterations=variance_iterations, engine=engine)
+    league = min(reduced, key=lambda l: maketeams3.team_rating_range(l['teams']))
+    return dict(point,
+                happiness=best.happiness,
+                rating_range=maketeams3.team_rating_range(league['teams']),
+                rating_variance=maketeams3.team_rating_variance(league['teams']))
+
+
+def dominates(a, b):
+    # a is at least as good as b on happiness, range and variance, and better on one of them
+    at_least = (a['happiness'] >= b['happiness'] and a['rating_range'] <= b['rating_range']
+                and a['rating_variance'] <= b['rating_variance'])
+    better = (a['happiness'] > b['happiness'] or a['rating_range'] < b['rating_range']
+              or a['rating_variance'] < b['rating_variance'])
+    return at_least and better
+
+
+def pareto(points):
+    made = [point for point in points if point['happiness'] is not None]
+    for point in points:
+        point['pareto'] = point in made and not any(dominates(other, point) for other in made)
+    return points
+
+
+@click.command()
+@click.option('--players', help='the json file containing the players.', required=True)
+@click.option('--boards', default='4,5,6,7,8', help='comma separated numbers of boards per team.')
+@click.option('--balance', default='0.6,0.7,0.8,0.9,1.0', help='comma separated proportions of full time players.')
+@click.option('--count', default=100, help='restarts per grid point')
+@click.option('--seed', type=int, default=None, help='seed for the restarts of every grid point (random if not given)')
+@click.option('--keep', default=100, help='most leagues of the best happiness to keep per grid point (0 for no limit)')
+@click.option('--variance-iterations', default=200, help='most swaps made when reducing rating variance')
+@click.option('--engine', default='python', type=click.Choice(['python', 'numpy']))
+@click.option('--jobs', default=1, type=click.IntRange(min=1), help='number of worker processes to run the grid points on')
+@click.option('--report', default=None, help='also write every point as json to this file')
+def run(players, boards, balance, count, seed, keep, variance_iterations, engine, jobs, report):
+    # The players file is parsed and names resolved once per process, and each grid point is one
+    # task. Points on the Pareto frontier of happiness against rating range and variance are starred
+    if seed is None:
+        seed = random.randrange(2**32)
+    print(f"Using seed {seed}", file=sys.stderr)
+    grid = [(int(b), float(x)) for b in boards.split(',') for x in balance.split(',')]
+    args = [(b, x, count, seed, keep, variance_iterations, engine) for b, x in grid]
+    if jobs > 1:
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=_start_worker, initargs=(players,))
+        try:
+            points = [future.result() for future in [pool.submit(sweep_point, *a) for a in args]]
+        except BaseException:
+            maketeams3._stop_workers(pool)
+            raise
+        pool.shutdown()
+    else:
+        _load_registrations(players)
+        points = [sweep_point(*a) for a in args]
+    pareto(points)
+
+    print(f"  {'boards':>6} {'balance':>7} {'teams':>5} {'alts':>5} {'happiness':>9} {'range':>8} {'variance':>9}")
+    for p in points:
+        line = f"{'*' if p['pareto'] else ' '} {p['boards']:>6} {p['balance']:>7} {p['teams']:>5} {p['alternates']:>5} "
+        if p['happiness'] is None:
+            print(line + "  not enough players for every board")
+        else:
+            print(line + f"{p['happiness']:>9} {p['rating_range']:>8.2f} {p['rating_variance']:>9.2f}")
+    if report:
+        with open(report, 'w') as outfile:
+            json.dump({'seed': seed, 'count': count, 'keep': keep, 'points': points}, outfile, indent=4)
+
+
+if __name__ == "__main__":
+    run()
@@ -31,16 +31,19 @@ def largeheader(txt, wrap=None):
     else:
         wrap = underline
     largecol(txt, wrap)
-def smallcol(txt, wrap=None):
+def smallcell(txt, wrap=None):
     if not wrap:
         wrap = lambda x: x
-    print(wrap(" {0: <6} |".format(txt)), end='')
-def largecol(txt, wrap=None):
+    return wrap(" {0: <6} |".format(txt))
+def largecell(txt, wrap=None):
     if not wrap:
         wrap = lambda x: x
-    print(wrap(" {0: <27} |".format(txt)), end='')
+    return wrap(" {0: <27} |".format(txt))
+def separator_line():
+    return "-{0:-<6}--".format("") + "-{0: <27}--".format("-"*27) * 6 + "\n"
+def smallcol(txt, wrap=None):
+    print(smallcell(txt, wrap), end='')
+def largecol(txt, wrap=None):
+    print(largecell(txt, wrap), end='')
 def separator():
-    print("-{0:-<6}--".format(""), end='')
-    for x in range(6):
-        print("-{0: <27}--".format("-"*27), end='')
-    print()
+    print(separator_line(), end='')
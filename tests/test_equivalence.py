@@ -0,0 +1,113 @@
+# The faster versions of the swap scoring, the hill-climb and reduce_variance are meant to make
+# exactly the same swaps as the straightforward ones, so a seed always gives the same league
+import importlib
+import random
+
+import pytest
+
+import maketeams3
+
+generate_test_data = importlib.import_module('generate-test-data')
+
+SEEDS = [1, 2, 3]
+
+
+def league_spec(n_players=300, boards=6, balance=0.8, seed=1):
+    player_data = generate_test_data.generate_players(n_players, random.Random(seed))
+    return maketeams3.compile_league(player_data, boards, balance)
+
+
+def shuffled_league(spec, seed):
+    # the teams make_league starts climbing from
+    rng = random.Random(seed)
+    players, players_split, _, _ = maketeams3.build_players(spec)
+    for board in players_split:
+        rng.shuffle(board)
+    teams = [maketeams3.Team(spec.boards) for _ in range(spec.num_teams)]
+    for n, board in enumerate(players_split):
+        for team, player in enumerate(board):
+            teams[team].changeBoard(n, player)
+    maketeams3.updatePref(players, teams)
+    maketeams3.updateSort(players, teams)
+    return players, teams
+
+
+def swapped_happiness(players, teams, swap):
+    # the league's happiness after making swap, measured by making it and scoring everyone
+    teama, playera, teamb, playerb, board = swap
+    maketeams3.swapPlayers(*swap)
+    maketeams3.updatePref(players, teams)
+    happiness = maketeams3.total_happiness(teams)
+    maketeams3.swapPlayers(teama, playerb, teamb, playera, board)
+    maketeams3.updatePref(players, teams)
+    return happiness
+
+
+def reference_climb(players, teams):
+    # the hill-climb as first written: after every swap everyone is rescored and resorted, and the
+    # search starts again from the least happy player
+    p = 0
+    while p < len(players):
+        player = players[p]
+        swaps = []
+        for friend in player.friends:
+            if friend.board != player.board and friend.team != player.team:
+                swap1 = (friend.team, friend, player.team, player.team.getPlayer(friend.board), friend.board)
+                swap2 = (player.team, player, friend.team, friend.team.getPlayer(player.board), player.board)
+                swaps.append(max((maketeams3.testSwap(*swap1), swap1), (maketeams3.testSwap(*swap2), swap2)))
+        for avoid in player.avoid:
+            if player.team == avoid.team:
+                for team in teams:
+                    swap = (avoid.team, avoid, team, team.getPlayer(avoid.board), avoid.board)
+                    swaps.append((maketeams3.testSwap(*swap), swap))
+        swaps.sort()
+        if swaps and swaps[-1][0] > 0:
+            maketeams3.swapPlayers(*swaps[-1][1])
+            maketeams3.updatePref(players, teams)
+            maketeams3.updateSort(players, teams)
+            p = 0
+        else:
+            p += 1
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_test_swap_is_the_happiness_change(seed):
+    spec = league_spec(seed=seed)
+    players, teams = shuffled_league(spec, seed)
+    rng = random.Random(seed)
+    before = maketeams3.total_happiness(teams)
+    for player in rng.sample(players, 40):
+        for team in teams:
+            swap = (player.team, player, team, team.getPlayer(player.board), player.board)
+            assert maketeams3.testSwap(*swap) == swapped_happiness(players, teams, swap) - before
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_move_scores_match_test_swap(seed):
+    spec = league_spec(seed=seed)
+    players, teams = shuffled_league(spec, seed)
+    for player in players:
+        expected = [maketeams3.testSwap(player.team, player, team, team.getPlayer(player.board), player.board)
+                    for team in teams]
+        assert maketeams3.moveScores(player, teams) == expected
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_hill_climb_makes_the_reference_swaps(seed):
+    spec = league_spec(seed=seed)
+    players, teams = shuffled_league(spec, seed)
+    reference_climb(players, teams)
+    league = maketeams3.make_league(spec, seed)
+    assert maketeams3.league_key(league) == maketeams3.league_key({'teams': teams})
+    assert [team.team_pref_score for team in league['teams']] == [team.team_pref_score for team in teams]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_numpy_reduce_variance_matches_python(seed):
+    pytest.importorskip('numpy')
+    spec = league_spec(seed=seed)
+    league = maketeams3.make_league(spec, seed)
+    packed = maketeams3.pack_league(league)
+    python = maketeams3.reduce_variance(maketeams3.unpack_league(spec, packed)['teams'], 0, 'python')
+    numpy = maketeams3.reduce_variance(maketeams3.unpack_league(spec, packed)['teams'], 0, 'numpy')
+    assert [[p.name for p in team.boards] for team in python] == [[p.name for p in team.boards] for team in numpy]